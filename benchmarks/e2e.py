@@ -0,0 +1,267 @@
+"""
+End-to-end sync benchmark against local fake Synchron and Calendar servers.
+
+Each size runs three syncs with the same SyncRunner, like consecutive runs
+of main.py: an initial sync into an empty calendar, a sync after churning
+the schedule, and a steady-state sync with nothing changed. The Google
+OAuth step is bypassed by building the Calendar service from the bundled
+discovery document pointed at the fake server.
+
+A final set of syncs geocodes the studios with a FakeGeocoder and checks
+how many lookups the GeoCache lets through: capped per run, none on a warm
+cache or for a cached miss, all again once the entries expired.
+
+    python benchmarks/e2e.py [--sizes 10 100 1000] [--churn 0.1] [--latency 0.0]
+                             [--workers 4] [--qps 0] [--quota N]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeCalendar, FakeGeocoder, FakeSynchron  # noqa: E402
+from benchmarks.pages import synthetic_appointments  # noqa: E402
+from synchron_sync.config import Config  # noqa: E402
+from synchron_sync.executor import TokenBucket  # noqa: E402
+from synchron_sync.geo import GeoCache, GeoPoint, LocationEnricher, location_key  # noqa: E402
+from synchron_sync.notify import NotificationBus  # noqa: E402
+from synchron_sync.state import load_state  # noqa: E402
+from synchron_sync.sync import SyncRunner  # noqa: E402
+
+
+class RecordingBus(NotificationBus):
+    """
+    Notification bus that only counts what it is asked to publish.
+    """
+
+    def __init__(self):
+        super().__init__([])
+        self.published = 0
+
+    def publish(self, title, message, **kwargs):
+        self.published += 1
+
+
+class FakeCalendarRunner(SyncRunner):
+    """
+    SyncRunner whose Calendar service talks to a FakeCalendar.
+    """
+
+    def __init__(self, config, notifier, calendar):
+        super().__init__(config, notifier)
+        self.calendar = calendar
+
+    def calendar_service(self):
+        if self.service is None:
+            self.service = self.calendar.build_service()
+        return self.service
+
+
+def churn(appointments, ratio, seed=1):
+    """
+    Returns a copy of appointments with ratio of them modified, removed and added each.
+    """
+    rng = random.Random(seed)
+    count = max(1, int(len(appointments) * ratio))
+    result = [dict(appointment) for appointment in appointments]
+
+    for appointment in rng.sample(result, count):
+        appointment['end_time'] = '23:30'
+    for appointment in rng.sample(result, count):
+        result.remove(appointment)
+
+    last_day = max(datetime.strptime(appointment['date'], '%d.%m.%Y') for appointment in appointments)
+    result.extend(synthetic_appointments(count, start=(last_day + timedelta(days=1)).date(), seed=seed))
+    return result
+
+
+def run(label, runner, synchron, calendar):
+    synchron_before, calendar_before = synchron.requests, calendar.requests
+    batch_before, limited_before = calendar.batch_items, calendar.rate_limited
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    result = runner.run_once()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    if not result.success:
+        raise SystemExit(f"{label} sync failed")
+    return (
+        label,
+        elapsed,
+        synchron.requests - synchron_before,
+        calendar.requests - calendar_before,
+        calendar.batch_items - batch_before,
+        calendar.rate_limited - limited_before,
+        peak,
+    )
+
+
+def benchmark(size, churn_ratio, latency, workers=4, qps=0.0, quota=None):
+    appointments = synthetic_appointments(size)
+    synchron = FakeSynchron(appointments, latency=latency).start()
+    calendar = FakeCalendar(latency=latency, quota=quota).start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            config = Config(
+                name=f"bench-{size}",
+                username='bench',
+                password='bench',
+                synchron_base_url=synchron.url,
+                state_dir=state_dir,
+                full_reconcile_interval=0,
+                status_log=None,
+                calendar_workers=workers,
+                calendar_qps=qps,
+            )
+            runner = FakeCalendarRunner(config, NotificationBus([]), calendar)
+
+            rows = [run('initial', runner, synchron, calendar)]
+            synchron.appointments = churn(appointments, churn_ratio)
+            rows.append(run('churned', runner, synchron, calendar))
+            rows.append(run('steady', runner, synchron, calendar))
+
+            live = sum(1 for event in calendar.events.values() if event['status'] != 'cancelled')
+            if live != len(synchron.appointments):
+                raise SystemExit(f"calendar holds {live} events, expected {len(synchron.appointments)}")
+            return rows
+    finally:
+        synchron.stop()
+        calendar.stop()
+
+
+def geocoding(latency, size=30, ttl=3600.0):
+    """
+    Syncs with geocoding enabled and checks the lookups of each run.
+
+    One studio address cannot be found and max_lookups leaves two studios
+    for the second run, whose events then only get a silent location
+    update. Returns (run, lookups, calendar writes, notifications) rows.
+    """
+    appointments = synthetic_appointments(size)
+    keys = {location_key(appointment['studio_name'], appointment['address']) for appointment in appointments}
+    missing = appointments[0]['address']
+    max_lookups = len(keys) - 2
+    now = [time.time()]
+
+    geocoder = FakeGeocoder(latency=latency, not_found=[missing])
+    synchron = FakeSynchron(appointments, latency=latency).start()
+    calendar = FakeCalendar(latency=latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            config = Config(
+                name='bench-geocode',
+                username='bench',
+                password='bench',
+                synchron_base_url=synchron.url,
+                state_dir=state_dir,
+                full_reconcile_interval=0,
+                status_log=None,
+                calendar_qps=0,
+            )
+            bus = RecordingBus()
+            runner = FakeCalendarRunner(config, bus, calendar)
+            runner.enricher = LocationEnricher(
+                geocoder,
+                GeoCache(config.state_path('geocode_cache.json'), ttl=ttl, clock=lambda: now[0]),
+                home=GeoPoint(52.52, 13.40, 'Berlin'),
+                rate_limiter=TokenBucket(1000.0),
+                max_lookups=max_lookups,
+            )
+
+            def cache_stamp():
+                # save_state renames a new file into place, so a rewrite changes the inode
+                stat = os.stat(config.state_path('geocode_cache.json'))
+                return stat.st_ino, stat.st_mtime_ns
+
+            rows = []
+            # (run, clock advance, expected lookups, expected notifications)
+            steps = [
+                ('cold', 0, max_lookups, len(appointments)),
+                ('rest', 1, len(keys) - max_lookups, 0),
+                ('warm', 1, 0, 0),
+                ('expired', ttl, max_lookups, 0),
+            ]
+            for label, advance, expected_lookups, expected_notifications in steps:
+                now[0] += advance
+                lookups, sequence, published = geocoder.lookups, calendar._sequence, bus.published
+                written = cache_stamp() if label == 'warm' else None
+                if not runner.run_once().success:
+                    raise SystemExit(f"geocoding {label} sync failed")
+                row = (label, geocoder.lookups - lookups, calendar._sequence - sequence, bus.published - published)
+                if row[1] != expected_lookups or row[3] != expected_notifications:
+                    raise SystemExit(f"geocoding {label}: {row[1]} lookups and {row[3]} notifications, "
+                                     f"expected {expected_lookups} and {expected_notifications}")
+                if written is not None and cache_stamp() != written:
+                    raise SystemExit("a warm run rewrote the geocoding cache")
+                rows.append(row)
+
+            located = [
+                event for event in calendar.events.values()
+                if 'latitude' in event['extendedProperties']['private']
+            ]
+            if len(located) != sum(1 for appointment in appointments if appointment['address'] != missing):
+                raise SystemExit(f"{len(located)} events carry a location")
+            if rows[1][2] == 0 or rows[2][2] != 0:
+                raise SystemExit("location-only updates did not happen exactly once")
+
+            # Least recently used entries go first once an added entry puts the cache over max_entries
+            path = config.state_path('geocode_cache.json')
+            cache = GeoCache(path, ttl=ttl, max_entries=len(load_state(path)), clock=lambda: now[0])
+            written = cache_stamp()
+            oldest, *recent = sorted(cache._entries)
+            for key in recent:
+                now[0] += 1
+                cache.get(key)
+            cache.save()
+            if cache_stamp() != written:
+                raise SystemExit("cache hits rewrote the cache file")
+            cache.put('added', None)
+            cache.save()
+            if sorted(load_state(path)) != sorted(recent + ['added']):
+                raise SystemExit(f"cache kept {sorted(load_state(path))}, expected {sorted(recent + ['added'])} "
+                                 f"without {oldest}")
+            return rows
+    finally:
+        synchron.stop()
+        calendar.stop()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    arg_parser.add_argument('--churn', type=float, default=0.1,
+                            help='share of appointments modified, removed and added between runs')
+    arg_parser.add_argument('--latency', type=float, default=0.0,
+                            help='seconds added to every fake server response')
+    arg_parser.add_argument('--workers', type=int, default=4, help='concurrent calendar batch requests')
+    arg_parser.add_argument('--qps', type=float, default=0.0,
+                            help='client-side calendar requests per second, 0 for unlimited')
+    arg_parser.add_argument('--quota', type=int, default=None,
+                            help='fake calendar requests per second before it answers rateLimitExceeded')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
+    tracemalloc.start()
+
+    print(f"{'rows':>6}  {'run':<8} {'wall':>10} {'synchron':>9} {'calendar':>9} {'batched':>8} "
+          f"{'limited':>8} {'peak mem':>10}")
+    for size in args.sizes:
+        for label, elapsed, synchron_requests, calendar_requests, batch_items, limited, peak in benchmark(
+                size, args.churn, args.latency, args.workers, args.qps, args.quota):
+            print(f"{size:>6}  {label:<8} {elapsed * 1000:>8.1f}ms {synchron_requests:>9} "
+                  f"{calendar_requests:>9} {batch_items:>8} {limited:>8} {peak / 1024:>8.0f}KiB")
+
+    print(f"\n{'geocoding':<10} {'lookups':>8} {'writes':>7} {'notified':>9}")
+    for label, lookups, writes, notified in geocoding(args.latency):
+        print(f"{label:<10} {lookups:>8} {writes:>7} {notified:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Local stand-ins for login.synchron.de and the Google Calendar v3 API, and
+an in-process geocoder and shared lease store.
+
+The servers run on 127.0.0.1 in a background thread, count the requests
+they receive and can add a fixed latency to every request.
+"""
+import hashlib
+import json
+import re
+import secrets
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from email.parser import FeedParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlparse
+
+from benchmarks.pages import render_events_page
+
+
+class _FakeServer:
+    """
+    Base class running handle(method, path, headers, body) behind an HTTP server.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with server.lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                status, headers, payload = server.handle(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+
+class FakeSynchron(_FakeServer):
+    """
+    Serves the CSRF page, the login form POST and the events page.
+
+    The events page is rendered from the appointments attribute, so tests can
+    change the schedule between runs.
+    """
+
+    def __init__(self, appointments, latency=0.0):
+        super().__init__(latency)
+        self.appointments = appointments
+        self.logins = 0
+        self._sessions = set()
+        self._csrf_token = secrets.token_hex(8)
+
+    def handle(self, method, path, headers, body):
+        parsed = urlparse(path)
+        cookies = dict(
+            part.strip().split('=', 1) for part in (headers.get('Cookie') or '').split(';') if '=' in part
+        )
+        logged_in = cookies.get('synchron_session') in self._sessions
+
+        if method == 'POST' and parsed.path == '/login':
+            form = parse_qs(body.decode('utf-8'))
+            if form.get('_token', [''])[0] != self._csrf_token or not form.get('username'):
+                return 419, {}, b'Page expired'
+            session_id = secrets.token_hex(16)
+            with self.lock:
+                self._sessions.add(session_id)
+                self.logins += 1
+            return 200, {
+                'Content-Type': 'text/html; charset=utf-8',
+                'Set-Cookie': f'synchron_session={session_id}; Path=/; HttpOnly',
+            }, b'<html><body><h1>Termine</h1></body></html>'
+
+        if method == 'GET' and parsed.path == '/events':
+            if not logged_in:
+                return 302, {'Location': '/login'}, b''
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, self.events_page(parsed).encode('utf-8')
+
+        if method == 'GET' and parsed.path in ('/', '/login'):
+            page = (
+                '<html><body><form method="post" action="/login?is_app=0">'
+                f'<input type="hidden" name="_token" value="{self._csrf_token}">'
+                '<input name="username"><input name="password" type="password">'
+                '</form></body></html>'
+            )
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, page.encode('utf-8')
+
+        return 404, {}, b'Not found'
+
+    def events_page(self, parsed_url):
+        return render_events_page(self.appointments)
+
+
+class FakePaginatedSynchron(FakeSynchron):
+    """
+    FakeSynchron whose events view takes a ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    range and is split into pages of page_size appointments, linked with
+    rel="next". Without a range it only shows the next default_days days.
+    """
+
+    def __init__(self, appointments, latency=0.0, page_size=25, default_days=14):
+        super().__init__(appointments, latency)
+        self.page_size = page_size
+        self.default_days = default_days
+
+    def events_page(self, parsed_url):
+        params = {key: values[0] for key, values in parse_qs(parsed_url.query).items()}
+        today = date.today()
+        start = date.fromisoformat(params['start']) if 'start' in params else today
+        end = date.fromisoformat(params['end']) if 'end' in params else today + timedelta(days=self.default_days - 1)
+        selected = [
+            appointment for appointment in self.appointments
+            if start <= datetime.strptime(appointment['date'], '%d.%m.%Y').date() <= end
+        ]
+
+        page = int(params.get('page', '1'))
+        next_url = None
+        if page * self.page_size < len(selected):
+            next_url = f"{parsed_url.path}?{urlencode(dict(params, page=page + 1))}"
+        return render_events_page(selected[(page - 1) * self.page_size:page * self.page_size], next_url)
+
+
+class FakeCalendar(_FakeServer):
+    """
+    In-memory Calendar v3 events API: list (with paging, time bounds,
+    privateExtendedProperty and sync tokens), get, insert, update, delete and
+    the multipart batch endpoint.
+
+    With quota set, API calls beyond quota per second (batch sub-requests
+    count individually) are rejected with 403 rateLimitExceeded and a
+    Retry-After header, like the real API.
+    """
+
+    def __init__(self, latency=0.0, quota=None):
+        super().__init__(latency)
+        self.quota = quota
+        self.batch_items = 0
+        self.rate_limited = 0
+        self.events = {}
+        self._sequence = 0
+        self._window = (0, 0)
+
+    def discovery_document(self):
+        """
+        The bundled Calendar discovery document, pointed at this server.
+        """
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc('calendar', 'v3'))
+        document['rootUrl'] = self.url + '/'
+        document['baseUrl'] = self.url + '/calendar/v3/'
+        return document
+
+    def build_service(self):
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+
+        return build_from_document(self.discovery_document(), http=httplib2.Http())
+
+    def handle(self, method, path, headers, body):
+        parsed = urlparse(path)
+        if method == 'POST' and parsed.path.startswith('/batch/'):
+            return self._handle_batch(headers, body)
+        status, payload = self._handle_api(method, parsed, body)
+        headers = {'Content-Type': 'application/json'}
+        if status == 403:
+            headers['Retry-After'] = '1'
+        return status, headers, json.dumps(payload).encode('utf-8')
+
+    def _over_quota(self):
+        if self.quota is None:
+            return False
+        second = int(time.monotonic())
+        with self.lock:
+            window, count = self._window
+            count = count + 1 if window == second else 1
+            self._window = (second, count)
+            if count > self.quota:
+                self.rate_limited += 1
+                return True
+        return False
+
+    def _handle_api(self, method, parsed, body):
+        if self._over_quota():
+            return 403, _error(403, 'Rate Limit Exceeded', 'rateLimitExceeded')
+        parts = [unquote(part) for part in parsed.path.strip('/').split('/')]
+        # calendar/v3/calendars/{calendarId}/events[/{eventId}]
+        if parts[:3] != ['calendar', 'v3', 'calendars'] or len(parts) < 5 or parts[4] != 'events':
+            return 404, _error(404, 'Not Found')
+        event_id = parts[5] if len(parts) > 5 else None
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        with self.lock:
+            if method == 'GET' and event_id is None:
+                return self._list(params)
+            if method == 'GET' and event_id:
+                event = self.events.get(event_id)
+                return (200, _public(event)) if event is not None else (404, _error(404, 'Not Found'))
+            if method == 'POST' and event_id is None:
+                return self._insert(json.loads(body))
+            if method == 'PUT' and event_id:
+                return self._update(event_id, json.loads(body))
+            if method == 'DELETE' and event_id:
+                return self._delete(event_id)
+        return 405, _error(405, 'Method Not Allowed')
+
+    def _next_sequence(self):
+        self._sequence += 1
+        return self._sequence
+
+    def _insert(self, event):
+        event_id = event.get('id') or uuid.uuid4().hex
+        # Ids of deleted events stay taken, as in the real API
+        if event_id in self.events:
+            return 409, _error(409, 'The requested identifier already exists.', 'duplicate')
+        event = dict(event, id=event_id, status='confirmed', htmlLink=f'{self.url}/event?eid={event_id}')
+        event['_sequence'] = self._next_sequence()
+        self.events[event_id] = event
+        return 200, _public(event)
+
+    def _update(self, event_id, event):
+        # Updating a deleted event restores it
+        existing = self.events.get(event_id)
+        if existing is None:
+            return 404, _error(404, 'Not Found')
+        event = dict(event, id=event_id, status='confirmed', htmlLink=f'{self.url}/event?eid={event_id}')
+        event['_sequence'] = self._next_sequence()
+        self.events[event_id] = event
+        return 200, _public(event)
+
+    def _delete(self, event_id):
+        existing = self.events.get(event_id)
+        if existing is None:
+            return 404, _error(404, 'Not Found')
+        if existing['status'] == 'cancelled':
+            return 410, _error(410, 'Resource has been deleted', 'deleted')
+        self.events[event_id] = {'id': event_id, 'status': 'cancelled', '_sequence': self._next_sequence()}
+        return 204, ''
+
+    def _list(self, params):
+        sync_token = params.get('syncToken')
+        if sync_token is not None:
+            if not sync_token.isdigit() or int(sync_token) > self._sequence:
+                return 410, _error(410, 'Sync token is no longer valid, a full sync is required.', 'fullSyncRequired')
+            items = [event for event in self.events.values() if event['_sequence'] > int(sync_token)]
+        else:
+            items = [event for event in self.events.values() if event['status'] != 'cancelled']
+
+        if 'privateExtendedProperty' in params:
+            key, _, value = params['privateExtendedProperty'].partition('=')
+            items = [
+                event for event in items
+                if event.get('extendedProperties', {}).get('private', {}).get(key) == value
+            ]
+        if 'timeMin' in params:
+            items = [event for event in items if _end(event) > _timestamp(params['timeMin'])]
+        if 'timeMax' in params:
+            items = [event for event in items if _start(event) < _timestamp(params['timeMax'])]
+        if params.get('orderBy') == 'startTime':
+            items.sort(key=_start)
+
+        offset = int(params.get('pageToken') or 0)
+        page_size = int(params.get('maxResults') or 250)
+        page = items[offset:offset + page_size]
+        result = {'kind': 'calendar#events', 'items': [_public(event) for event in page]}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        elif not any(key in params for key in ('timeMin', 'timeMax', 'privateExtendedProperty')):
+            result['nextSyncToken'] = str(self._sequence)
+        return 200, result
+
+    def _handle_batch(self, headers, body):
+        parser = FeedParser()
+        parser.feed(f"Content-Type: {headers['Content-Type']}\r\n\r\n")
+        parser.feed(body.decode('utf-8'))
+        message = parser.close()
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in message.get_payload():
+            with self.lock:
+                self.batch_items += 1
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, target, _ = request_line.split(' ', 2)
+            _, _, sub_body = rest.replace('\r\n', '\n').partition('\n\n')
+            status, payload = self._handle_api(method, urlparse(target), sub_body.encode('utf-8'))
+            content = json.dumps(payload) if payload != '' else ''
+            # Long Content-IDs arrive folded over several lines
+            content_id = re.sub(r'\r?\n', '', part['Content-ID'])
+            retry_after = 'Retry-After: 1\r\n' if status == 403 else ''
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n"
+                f"{retry_after}\r\n"
+                f"{content}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return 200, {'Content-Type': f'multipart/mixed; boundary={boundary}'}, ''.join(chunks).encode('utf-8')
+
+
+class FakeGeocoder:
+    """
+    Geocoder for synchron_sync.geo that places every query at a stable
+    pseudo-random point around Berlin and counts its lookups.
+
+    Queries in not_found resolve to nothing.
+    """
+
+    def __init__(self, latency=0.0, not_found=()):
+        self.latency = latency
+        self.not_found = set(not_found)
+        self.lookups = 0
+
+    def geocode(self, query):
+        from synchron_sync.geo import GeoPoint
+
+        self.lookups += 1
+        time.sleep(self.latency)
+        if query in self.not_found:
+            return None
+        seed = int.from_bytes(hashlib.sha256(query.encode('utf-8')).digest()[:8], 'big')
+        latitude = 52.52 + ((seed & 0xFFFF) / 0xFFFF - 0.5) * 0.3
+        longitude = 13.40 + ((seed >> 16 & 0xFFFF) / 0xFFFF - 0.5) * 0.5
+        return GeoPoint(latitude, longitude, f"{query}, Berlin")
+
+
+class FakeLeaseStore:
+    """
+    Shared lease store for synchron_sync.lease.RunLease, kept in memory.
+
+    Stands in for a store shared between machines; clock can be advanced
+    to expire leases.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, owner, ttl):
+        with self._lock:
+            current = self.leases.get(name)
+            if current and current[0] != owner and current[1] > self.clock():
+                return False
+            self.leases[name] = (owner, self.clock() + ttl)
+            return True
+
+    def renew(self, name, owner, ttl):
+        with self._lock:
+            current = self.leases.get(name)
+            if not current or current[0] != owner:
+                return False
+            self.leases[name] = (owner, self.clock() + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            if self.leases.get(name, (None,))[0] == owner:
+                del self.leases[name]
+
+
+def _public(event):
+    return {key: value for key, value in event.items() if not key.startswith('_')}
+
+
+def _error(code, message, reason='error'):
+    return {'error': {'code': code, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
+
+
+def _timestamp(value):
+    from dateutil import parser
+
+    return parser.isoparse(value).timestamp()
+
+
+def _start(event):
+    return _timestamp(event['start']['dateTime'])
+
+
+def _end(event):
+    return _timestamp(event['end']['dateTime'])
@@ -0,0 +1,87 @@
+"""
+Size and query speed of a year of schedule history.
+
+Simulates 15-minute polling of a schedule of --size appointments for a
+year, where --change-rate of the polls see a changed schedule (one
+appointment moved, dropped or added). Every poll is offered to a
+HistoryStore, which keeps only the changed snapshots. Reports the bytes on
+disk and the time of typical queries.
+
+    python benchmarks/history.py [--size 100] [--change-rate 0.05] [--days 365]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import synthetic_appointments  # noqa: E402
+from synchron_sync.appointments import appointments_digest  # noqa: E402
+from synchron_sync.history import HistoryStore  # noqa: E402
+
+POLL_SECONDS = 15 * 60
+
+
+def simulate(store, size, change_rate, days, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    appointments = synthetic_appointments(size, start=start.date(), seed=seed)
+    next_day = start.date() + timedelta(days=size // 3 + 1)
+    written = 0
+    for poll in range(days * 24 * 60 * 60 // POLL_SECONDS):
+        taken = start.timestamp() + poll * POLL_SECONDS
+        if rng.random() < change_rate:
+            appointments = [dict(appointment) for appointment in appointments]
+            choice = rng.random()
+            if choice < 0.5:
+                rng.choice(appointments)['end_time'] = rng.choice(['18:00', '19:30', '21:00'])
+            elif choice < 0.75 and len(appointments) > 1:
+                appointments.pop(rng.randrange(len(appointments)))
+            else:
+                appointments += synthetic_appointments(1, start=next_day, seed=poll)
+                next_day += timedelta(days=1)
+        written += store.append(appointments, appointments_digest(appointments), taken=taken)
+    return written
+
+
+def disk_usage(root):
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(root) for name in names
+    )
+
+
+def timed(label, query):
+    t0 = time.perf_counter()
+    result = query()
+    print(f"{label:<36} {(time.perf_counter() - t0) * 1000:8.1f} ms  {len(result)} rows")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--size', type=int, default=100)
+    arg_parser.add_argument('--change-rate', type=float, default=0.05)
+    arg_parser.add_argument('--days', type=int, default=365)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        store = HistoryStore(root)
+        t0 = time.perf_counter()
+        written = simulate(store, args.size, args.change_rate, args.days)
+        polls = args.days * 24 * 60 * 60 // POLL_SECONDS
+        print(f"{polls} polls, {written} snapshots stored in {time.perf_counter() - t0:.1f} s, "
+              f"{disk_usage(root) / 1024:.0f} KiB on disk")
+
+        june, july = datetime(2025, 6, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc)
+        timed("load one column, one month", lambda: store.load(['studio_name'], june, july))
+        timed("load all columns, whole year", lambda: store.load())
+        timed("first_seen", lambda: store.first_seen())
+        timed("studio_changes", lambda: store.studio_changes())
+
+
+if __name__ == "__main__":
+    main()
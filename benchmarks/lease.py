@@ -0,0 +1,116 @@
+"""
+Overlapping syncs of one account guarded by a shared run lease.
+
+Runs SyncRunners against local fake Synchron and Calendar servers, with
+their RunLease kept in a FakeLeaseStore on a controlled clock, and checks
+that the calendar is only changed by the run holding the lease:
+
+- a run finding the lease held by another live run skips the sync
+- a run finding an expired lease takes it over and syncs
+- a run whose lease is taken over mid-run leaves the calendar alone
+- a run waiting for the lease gives up as soon as shutdown is requested
+
+    python benchmarks/lease.py [--size 30] [--ttl 0.6]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.e2e import FakeCalendarRunner  # noqa: E402
+from benchmarks.fakes import FakeCalendar, FakeLeaseStore, FakeSynchron  # noqa: E402
+from benchmarks.pages import synthetic_appointments  # noqa: E402
+from synchron_sync.config import Config  # noqa: E402
+from synchron_sync.lease import RunLease  # noqa: E402
+from synchron_sync.notify import NotificationBus  # noqa: E402
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--size', type=int, default=30, help='appointments on the fake server')
+    arg_parser.add_argument('--ttl', type=float, default=0.6, help='lease ttl in seconds')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
+
+    appointments = synthetic_appointments(args.size)
+    # Slow enough that a heartbeat (every ttl / 3) runs while the page loads
+    synchron = FakeSynchron(appointments, latency=args.ttl / 2).start()
+    calendar = FakeCalendar().start()
+    now = [time.time()]
+    store = FakeLeaseStore(clock=lambda: now[0])
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            config = Config(
+                name='bench-lease',
+                username='bench',
+                password='bench',
+                synchron_base_url=synchron.url,
+                state_dir=state_dir,
+                full_reconcile_interval=0,
+                status_log=None,
+                calendar_qps=0,
+            )
+            runner = FakeCalendarRunner(config, NotificationBus([]), calendar)
+            runner.lease = RunLease(store, 'sync', args.ttl)
+            other = RunLease(store, 'sync', args.ttl)
+
+            def sync(label, expect_success, expect_writes):
+                sequence = calendar._sequence
+                t0 = time.perf_counter()
+                result = runner.run_once()
+                writes = calendar._sequence - sequence
+                print(f"{label:<28} {(time.perf_counter() - t0) * 1000:>8.1f}ms {str(result.success):>8} "
+                      f"{writes:>7}")
+                if result.success != expect_success or writes != expect_writes:
+                    raise SystemExit(f"{label}: success {result.success} with {writes} calendar writes, "
+                                     f"expected {expect_success} with {expect_writes}")
+
+            print(f"{'run':<28} {'wall':>10} {'success':>8} {'writes':>7}")
+            if not other.acquire():
+                raise SystemExit("could not take the free lease")
+            sync('overlapping a live run', True, 0)
+            other.release()
+
+            # A crashed run leaves its lease behind until it runs out
+            store.leases['sync'] = ('crashed', now[0] + args.ttl)
+            now[0] += args.ttl + 1
+            sync('after a stale lease', True, len(appointments))
+
+            # Taken over while the page loads; the heartbeat notices before the mutations
+            synchron.appointments = appointments[1:]
+
+            def take_over():
+                time.sleep(args.ttl / 4)
+                store.leases['sync'] = ('intruder', now[0] + 3600)
+
+            thief = threading.Thread(target=take_over)
+            thief.start()
+            sync('lease lost mid-run', False, 0)
+            thief.join()
+            live = sum(1 for event in calendar.events.values() if event['status'] != 'cancelled')
+            if live != len(appointments):
+                raise SystemExit(f"calendar holds {live} events, expected {len(appointments)}")
+
+            stop = threading.Event()
+            stop.set()
+            waiting = RunLease(store, 'sync', args.ttl, sleep=stop.wait)
+            t0 = time.perf_counter()
+            if waiting.acquire(wait=60, poll_interval=1):
+                raise SystemExit("took a lease held by another run")
+            elapsed = time.perf_counter() - t0
+            print(f"{'wait during shutdown':<28} {elapsed * 1000:>8.1f}ms")
+            if elapsed > 1:
+                raise SystemExit("waiting for the lease ignored the shutdown")
+    finally:
+        synchron.stop()
+        calendar.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Synthetic Synchron events pages for benchmarks.
+
+Rows use the same inline styles that synchron_sync.synchron.parse_appointments
+matches on.
+"""
+import random
+from datetime import date, timedelta
+from html import escape
+
+from synchron_sync.synchron import APPOINTMENT_ROW_STYLE, DATE_ROW_STYLE
+
+STUDIOS = [
+    ('Studio Babelsberg', 'August-Bebel-Str. 26-53', '14482 Potsdam'),
+    ('Interopa Film', 'Eisenzahnstr. 1', '10709 Berlin'),
+    ('FFS Film- & Fernseh-Synchron', 'Lindenstr. 39', '10969 Berlin'),
+    ('SDI Media', 'Unter den Eichen 5', '65195 Wiesbaden'),
+    ('Scalamedia', 'Leopoldstr. 250', '80807 München'),
+]
+
+DIRECTORS = ['', 'Regie: Anna Weber', 'Regie: Jan Kramer', 'Regie: Mia Schulz']
+
+
+def synthetic_appointments(count, start=None, seed=0, per_day=3):
+    """
+    Returns count appointment dicts spread over consecutive days, per_day (at most 5) per day.
+    """
+    rng = random.Random(seed)
+    start = start or date.today() + timedelta(days=1)
+    appointments = []
+    for index in range(count):
+        day = start + timedelta(days=index // per_day)
+        hour = 8 + 3 * (index % per_day)
+        # Distinct studios within a day keep generate_appointment_id unique
+        if index % per_day == 0:
+            day_studios = rng.sample(STUDIOS, per_day)
+        studio_name, street, city = day_studios[index % per_day]
+        appointments.append({
+            'date': day.strftime('%d.%m.%Y'),
+            'start_time': f"{hour:02d}:00",
+            'end_time': f"{hour + 2:02d}:{rng.choice(['00', '30'])}",
+            'studio_name': studio_name,
+            'address': f"{street} {city}",
+            'regie': rng.choice(DIRECTORS),
+        })
+    return appointments
+
+
+def render_events_page(appointments, next_url=None):
+    """
+    Renders appointments as an events page; consecutive appointments on the same date share a header row.
+
+    With next_url, the page ends with a rel="next" pagination link to it.
+    """
+    rows = []
+    current_date = None
+    for appointment in appointments:
+        if appointment['date'] != current_date:
+            current_date = appointment['date']
+            rows.append(
+                f'<tr style="{DATE_ROW_STYLE}"><td>Termin</td><td>{escape(current_date)}</td></tr>'
+            )
+        studio_lines = [f"<b>{escape(appointment['studio_name'])}</b>"]
+        if appointment['address']:
+            studio_lines.append(escape(appointment['address']))
+        if appointment['regie']:
+            studio_lines.append(escape(appointment['regie']))
+        rows.append(
+            f'<tr style="{APPOINTMENT_ROW_STYLE}">'
+            f"<td>{escape(appointment['start_time'])}<br>\n{escape(appointment['end_time'])}</td>"
+            f"<td>{'<br>'.join(studio_lines)}</td>"
+            '<td></td><td></td><td><a href="#">Details</a></td>'
+            '</tr>'
+        )
+    return (
+        '<!DOCTYPE html><html><head><title>Termine</title></head><body>'
+        '<h1>Termine</h1><table class="table">'
+        + '\n'.join(rows)
+        + '</table>'
+        + (f'<nav><a class="page-link" href="{escape(next_url)}" rel="next">&raquo;</a></nav>' if next_url else '')
+        + '</body></html>'
+    )
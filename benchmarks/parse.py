@@ -0,0 +1,102 @@
+"""
+Compares parse_appointments against the previous find_previous-based parser.
+
+The previous parser is reproduced below without its 8-row cap so both
+implementations parse every row.
+
+    python benchmarks/parse.py [--sizes 100 500 2000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from benchmarks.pages import render_events_page, synthetic_appointments  # noqa: E402
+from synchron_sync.synchron import parse_appointments  # noqa: E402
+
+
+def legacy_parse_appointments(html_content):
+    appointments = []
+    soup = BeautifulSoup(html_content, 'html.parser')
+    appointment_rows = soup.find_all('tr', style='color: black; background: whitesmoke')
+
+    for row in appointment_rows:
+        columns = row.find_all('td')
+        if len(columns) == 5:
+            date_element = row.find_previous('tr', style='color: white; background: #9BC7E6; width: 100px')
+            date = date_element.find_all('td')[1].get_text(strip=True) if date_element else ''
+
+            time_range = columns[0].get_text(strip=True).replace('\n', ' ')
+            studio_name_element = columns[1].find('b')
+            studio_name = studio_name_element.get_text(strip=True) if studio_name_element else ''
+
+            column_texts = list(columns[1].stripped_strings)
+            if studio_name in column_texts:
+                column_texts.remove(studio_name)
+
+            address = ''
+            regie = ''
+            for text in column_texts:
+                if text.startswith('Regie:'):
+                    regie = text
+                else:
+                    address += text + ' '
+
+            appointments.append({
+                'date': date,
+                'start_time': time_range[:5],
+                'end_time': time_range[5:].strip(),
+                'studio_name': studio_name,
+                'address': address.strip(),
+                'regie': regie
+            })
+
+    return appointments
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    implementations = [
+        ('legacy', legacy_parse_appointments),
+        ('html.parser', lambda html: parse_appointments(html, backend='html.parser')),
+    ]
+    try:
+        import lxml  # noqa: F401
+        implementations.append(('lxml', lambda html: parse_appointments(html, backend='lxml')))
+    except ImportError:
+        print("lxml is not installed; skipping the lxml backend.")
+
+    print(f"{'rows':>6}  " + '  '.join(f"{name:>12}" for name, _ in implementations) + '   speedup')
+    for size in args.sizes:
+        expected = synthetic_appointments(size)
+        html = render_events_page(expected)
+        timings = []
+        for name, func in implementations:
+            elapsed, result = best_of(args.repeat, func, html)
+            if result != expected:
+                raise SystemExit(f"{name} parser returned different appointments for {size} rows")
+            timings.append(elapsed)
+        print(f"{size:>6}  " + '  '.join(f"{t * 1000:>10.1f}ms" for t in timings)
+              + f"  {timings[0] / min(timings[1:]):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Date-windowed scraping against a local paginated Synchron stand-in.
+
+Serves --size appointments spread over the coming months from a
+FakePaginatedSynchron, then scrapes them with the single events page and
+with an EventsWindow at 1 and --workers concurrent page fetches. Checks
+that the windowed scrapes find exactly the appointments inside the window.
+
+    python benchmarks/scrape.py [--size 600] [--days 180] [--page-size 25]
+                                [--latency 0.05] [--workers 4]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakePaginatedSynchron  # noqa: E402
+from benchmarks.pages import synthetic_appointments  # noqa: E402
+from synchron_sync.appointments import appointments_digest  # noqa: E402
+from synchron_sync.synchron import EventsWindow, login_with_retry  # noqa: E402
+from synchron_sync.transport import build_adapter, build_session  # noqa: E402
+
+
+def scrape(synchron, window, workers):
+    session = build_session(build_adapter(pool_maxsize=workers))
+    before = synchron.requests
+    t0 = time.perf_counter()
+    success, appointments = login_with_retry(
+        session, synchron.url, f"{synchron.url}/login?is_app=0", 'bench', 'bench', max_retries=1, window=window,
+    )
+    elapsed = time.perf_counter() - t0
+    if not success:
+        raise SystemExit("scrape failed")
+    return appointments, elapsed, synchron.requests - before
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--size', type=int, default=600, help='appointments on the fake server')
+    arg_parser.add_argument('--days', type=int, default=180, help='days ahead to scrape')
+    arg_parser.add_argument('--range-days', type=int, default=14)
+    arg_parser.add_argument('--page-size', type=int, default=25, help='appointments per page')
+    arg_parser.add_argument('--latency', type=float, default=0.05,
+                            help='seconds added to every fake server response')
+    arg_parser.add_argument('--workers', type=int, default=4, help='concurrent page fetches')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
+
+    appointments = synthetic_appointments(args.size, start=date.today())
+    last_day = date.today() + timedelta(days=args.days - 1)
+    expected = [
+        appointment for appointment in appointments
+        if datetime.strptime(appointment['date'], '%d.%m.%Y').date() <= last_day
+    ]
+    synchron = FakePaginatedSynchron(appointments, latency=args.latency, page_size=args.page_size).start()
+    try:
+        print(f"{'mode':<24} {'wall':>10} {'requests':>9} {'found':>6} {'expected':>9}")
+        modes = [('single page', None, 1)] + [
+            (f"window, {workers} worker{'s' if workers > 1 else ''}",
+             EventsWindow(args.days, args.range_days, max_workers=workers), workers)
+            for workers in sorted({1, args.workers})
+        ]
+        for label, window, workers in modes:
+            found, elapsed, request_count = scrape(synchron, window, workers)
+            print(f"{label:<24} {elapsed * 1000:>8.1f}ms {request_count:>9} {len(found):>6} {len(expected):>9}")
+            if window is not None and appointments_digest(found) != appointments_digest(expected):
+                raise SystemExit(f"{label}: scraped appointments differ from the window")
+    finally:
+        synchron.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Same-day sessions and event id collisions against a local fake Calendar.
+
+A studio with a morning and an afternoon session on one day gives both the
+same appointment id, so they get numbered session ids. Runs a SyncRunner
+with an ICS feed against FakeSynchron and FakeCalendar and checks:
+
+- cancelling the morning session deletes only its event, and the afternoon
+  session keeps its event and its feed UID
+- a returning session whose id is held by its own deleted event revives it
+- an insert whose id is held by a foreign event moves on to the next
+  session id and leaves that event alone
+- an insert finding MAX_SESSION_PROBES more ids taken gives up
+
+    python benchmarks/sessions.py [--size 9]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.e2e import FakeCalendarRunner, RecordingBus  # noqa: E402
+from benchmarks.fakes import FakeCalendar, FakeSynchron  # noqa: E402
+from benchmarks.pages import synthetic_appointments  # noqa: E402
+from synchron_sync.appointments import session_id, to_appointment  # noqa: E402
+from synchron_sync.config import Config  # noqa: E402
+from synchron_sync.sync import MAX_SESSION_PROBES  # noqa: E402
+
+UID = re.compile(r'^UID:(\S+)@', re.MULTILINE)
+
+
+def foreign_event(calendar, event_id, appointment):
+    # An event the script did not create, so the listing never shows it
+    calendar.events[event_id] = {
+        'id': event_id,
+        'status': 'confirmed',
+        'summary': 'Dentist',
+        'start': {'dateTime': to_appointment(appointment).start_datetime.isoformat()},
+        'end': {'dateTime': to_appointment(appointment).end_datetime.isoformat()},
+        '_sequence': calendar._next_sequence(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--size', type=int, default=9, help='appointments besides the extra sessions')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'ERROR').upper(), format='%(message)s')
+
+    appointments = synthetic_appointments(args.size)
+    morning = appointments[0]
+    afternoon = dict(morning, start_time='17:00', end_time='19:00')
+    # Fresh appointment ids for the collision checks, on days after the others
+    later = synthetic_appointments(2, start=to_appointment(appointments[-1]).start_datetime.date(), seed=7, per_day=1)
+    later = [dict(appointment, studio_name=f"{appointment['studio_name']} {index}")
+             for index, appointment in enumerate(later)]
+
+    synchron = FakeSynchron(appointments + [afternoon]).start()
+    calendar = FakeCalendar().start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            config = Config(
+                name='bench-sessions',
+                username='bench',
+                password='bench',
+                synchron_base_url=synchron.url,
+                state_dir=state_dir,
+                full_reconcile_interval=0,
+                status_log=None,
+                calendar_qps=0,
+                ics_file=os.path.join(state_dir, 'synchron.ics'),
+            )
+            bus = RecordingBus()
+            runner = FakeCalendarRunner(config, bus, calendar)
+            appointment_id = to_appointment(morning).appointment_id
+
+            def sync(label):
+                published, sequence = bus.published, calendar._sequence
+                runner.run_once()
+                live = {event_id for event_id, event in calendar.events.items() if event['status'] != 'cancelled'}
+                with open(config.ics_file, 'r', encoding='utf-8') as f:
+                    uids = set(UID.findall(f.read()))
+                print(f"{label:<28} {calendar._sequence - sequence:>7} {bus.published - published:>9} {len(live):>5}")
+                return live, uids
+
+            def check(condition, message):
+                if not condition:
+                    raise SystemExit(message)
+
+            print(f"{'run':<28} {'writes':>7} {'notified':>9} {'live':>5}")
+            live, uids = sync('initial')
+            afternoon_id = session_id(appointment_id, 1)
+            check({appointment_id, afternoon_id} <= live, "both sessions need their own event")
+            check({appointment_id, afternoon_id} <= uids, "both sessions need their own feed UID")
+
+            synchron.appointments = appointments[1:] + [afternoon]
+            live, uids = sync('morning cancelled')
+            check(appointment_id not in live and afternoon_id in live, "only the morning event may go")
+            check(appointment_id not in uids and afternoon_id in uids, "the afternoon feed UID must not change")
+
+            synchron.appointments = appointments + [afternoon]
+            live, uids = sync('morning back')
+            check(appointment_id in live and afternoon_id in live, "the morning event must be revived")
+            check(calendar.events[afternoon_id]['start']['dateTime'].startswith(
+                to_appointment(afternoon).start_datetime.isoformat()[:16]), "the afternoon event must not move")
+
+            taken_id = to_appointment(later[0]).appointment_id
+            foreign_event(calendar, taken_id, later[0])
+            synchron.appointments = appointments + [afternoon, later[0]]
+            live, _ = sync('id held by a foreign event')
+            check(calendar.events[taken_id]['summary'] == 'Dentist', "the foreign event must stay untouched")
+            check(session_id(taken_id, 1) in live, "the new session must move on to the next id")
+
+            blocked_id = to_appointment(later[1]).appointment_id
+            for ordinal in range(MAX_SESSION_PROBES + 1):
+                foreign_event(calendar, session_id(blocked_id, ordinal), later[1])
+            synchron.appointments = appointments + [afternoon, later[0], later[1]]
+            live, _ = sync('every id held')
+            check(session_id(blocked_id, MAX_SESSION_PROBES + 1) not in calendar.events, "probing must stop")
+            check(all(calendar.events[session_id(blocked_id, ordinal)]['summary'] == 'Dentist'
+                      for ordinal in range(MAX_SESSION_PROBES + 1)), "the foreign events must stay untouched")
+    finally:
+        synchron.stop()
+        calendar.stop()
+
+
+if __name__ == "__main__":
+    main()
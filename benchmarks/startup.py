@@ -0,0 +1,54 @@
+"""
+Measures cold-start cost of importing the sync package.
+
+Each sample imports ``synchron_sync`` in a fresh interpreter and reports the
+wall time, and checks that the Google client libraries stay unloaded.
+
+    python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import sys, time\n"
+    "t0 = time.perf_counter()\n"
+    "import synchron_sync\n"
+    "elapsed = time.perf_counter() - t0\n"
+    "heavy = sorted(m for m in ('googleapiclient', 'google.oauth2') if m in sys.modules)\n"
+    "print(elapsed, ','.join(heavy))\n"
+)
+
+
+def measure(runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            cwd=REPO_ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        if len(output) > 1:
+            raise SystemExit(f"Heavy modules loaded at import time: {output[1]}")
+        samples.append(float(output[0]))
+    return samples
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--runs', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    samples = measure(args.runs)
+    print(f"import synchron_sync: median {statistics.median(samples) * 1000:.1f} ms, "
+          f"min {min(samples) * 1000:.1f} ms over {len(samples)} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Synchron (login.synchron.de) to Google Calendar sync.
+
+Importing this package performs no network I/O; call :func:`run_sync` to run
+a sync.
+"""
+from .sync import run_sync
+
+__all__ = ['run_sync']
@@ -0,0 +1,114 @@
+"""
+Syncing many Synchron accounts into their own calendars concurrently.
+
+Accounts are listed in a JSON file:
+
+    {
+        "accounts": [
+            {"name": "anna", "username": "anna", "password": "${ANNA_PASSWORD}",
+             "calendar_id": "abc123@group.calendar.google.com"},
+            {"name": "jan", "username": "jan", "password": "${JAN_PASSWORD}"}
+        ]
+    }
+
+Every entry may set any Config field; fields it leaves out come from the
+environment (see load_config), and ${VAR} references are expanded from the
+environment so secrets can stay out of the file. Each account keeps its
+state in its own subdirectory of the state directory, and its schedule
+history in its own subdirectory of the history directory. Accounts
+cannot share an ICS feed; '{name}' in ics_file is replaced with the
+account name, so ICS_FILE=feeds/{name}.ics gives every account its own.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields, replace
+from typing import Dict, List, Optional
+
+from .config import Config, load_config
+from .notify import build_notification_bus
+from .sync import SyncRunner
+from .transport import CircuitBreaker, build_adapter, build_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def load_accounts(path: str, base: Optional[Config] = None) -> List[Config]:
+    """
+    Reads the account list from a JSON file.
+
+    Args:
+        path: Path of the accounts file
+        base: Config supplying defaults; read from the environment when omitted
+
+    Returns:
+        One Config per account
+    """
+    if base is None:
+        base = load_config()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)['accounts']
+
+    known = {field.name for field in fields(Config)}
+    configs = []
+    for index, entry in enumerate(entries):
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown fields for account {index + 1}: {', '.join(sorted(unknown))}")
+        values = {key: os.path.expandvars(value) if isinstance(value, str) else value for key, value in entry.items()}
+        name = values.setdefault('name', values.get('username') or f"account{index + 1}")
+        values.setdefault('state_dir', os.path.join(base.state_dir, name))
+        if base.history_dir:
+            values.setdefault('history_dir', os.path.join(base.history_dir, name))
+        ics_file = values.get('ics_file', base.ics_file)
+        if ics_file:
+            values['ics_file'] = ics_file.replace('{name}', name)
+        configs.append(replace(base, **values))
+
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Account names must be unique")
+    ics_files = [config.ics_file for config in configs if config.ics_file]
+    if len(set(ics_files)) != len(ics_files):
+        raise ValueError("Accounts must not share an ics_file; include {name} in its path")
+    return configs
+
+
+def run_accounts(configs: List[Config], max_workers: int = DEFAULT_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Syncs every account once, at most max_workers at the same time.
+
+    Each account gets its own session and runner, so one failing account
+    does not affect the others; the Synchron and Pushover connection pools
+    and the Synchron circuit breaker are shared.
+
+    Returns:
+        Dict mapping account name to whether its sync succeeded
+    """
+    # Every account may fetch synchron_page_workers listing pages at once
+    page_workers = max((config.synchron_page_workers for config in configs), default=1)
+    http_adapter = build_adapter(pool_maxsize=max_workers * max(page_workers, 1))
+    notify_session = build_session(http_adapter)
+    # All accounts log in to the same Synchron host
+    breaker = CircuitBreaker()
+
+    def sync_account(config: Config) -> bool:
+        notifier = build_notification_bus(config, notify_session)
+        try:
+            return SyncRunner(config, notifier, http_adapter, breaker).run_once().success
+        except Exception as e:
+            logger.warning(f"[{config.name}] Sync failed with error: {str(e)}")
+            return False
+        finally:
+            notifier.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='account') as executor:
+        results = dict(zip((config.name for config in configs), executor.map(sync_account, configs)))
+
+    for name, success in results.items():
+        logger.info(f"[{name}] {'ok' if success else 'FAILED'}")
+    return results
@@ -0,0 +1,146 @@
+"""
+Appointment records and the identifiers derived from them.
+
+parse_appointments yields plain dicts; select_future_appointments turns
+them into Appointment records for the calendar sync.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+
+from .config import TIMEZONE
+
+SCRAPED_FIELDS = ('date', 'start_time', 'end_time', 'studio_name', 'address', 'regie')
+
+
+def generate_appointment_id(appointment):
+    # Concatenate date, studio_name, regie
+    id_string = f"{appointment['date']}_{appointment['studio_name']}_{appointment.get('regie', '')}"
+    # Generate a hash
+    appointment_id = hashlib.md5(id_string.encode('utf-8')).hexdigest()
+    return appointment_id
+
+
+def appointments_digest(appointments):
+    """
+    Returns a digest of the scraped appointment set that ignores row order.
+    """
+    rows = sorted(
+        json.dumps([appointment.get(field, '') for field in SCRAPED_FIELDS], ensure_ascii=False)
+        for appointment in appointments
+    )
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class Appointment:
+    """
+    A scraped appointment with its localized times and derived identifiers.
+    """
+    date: str
+    start_time: str
+    end_time: str
+    studio_name: str
+    address: str
+    regie: str
+    start_datetime: datetime
+    end_datetime: datetime
+    appointment_id: str
+    fingerprint: str
+
+
+def content_fingerprint(start, end, location, regie, summary):
+    """
+    Hash of everything a calendar event shows for an appointment.
+
+    Stored in the event's private extended properties, so comparing it with
+    the fingerprint of a fresh scrape tells whether the event is up to date.
+    start and end are ISO 8601 strings, so the same hash can be taken of a
+    listed event's own fields.
+    """
+    content = '\x1f'.join([start, end, location, regie.strip(), summary])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def to_appointment(appointment, tz=None):
+    """
+    Builds an Appointment record from a scraped appointment dict.
+    """
+    tz = tz or pytz.timezone(TIMEZONE)
+    start_datetime_str = f"{appointment['date']} {appointment['start_time']}"
+    end_datetime_str = f"{appointment['date']} {appointment['end_time']}"
+
+    start_datetime = tz.localize(datetime.strptime(start_datetime_str, '%d.%m.%Y %H:%M'))
+    end_datetime = tz.localize(datetime.strptime(end_datetime_str, '%d.%m.%Y %H:%M'))
+    regie = appointment.get('regie', '')
+    return Appointment(
+        date=appointment['date'],
+        start_time=appointment['start_time'],
+        end_time=appointment['end_time'],
+        studio_name=appointment['studio_name'],
+        address=appointment['address'],
+        regie=regie,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        appointment_id=generate_appointment_id(appointment),
+        fingerprint=content_fingerprint(
+            start_datetime.isoformat(), end_datetime.isoformat(), appointment['address'], regie,
+            appointment['studio_name'],
+        ),
+    )
+
+
+def session_order(appointment):
+    """
+    Orders appointments that share an appointment_id (same day, studio and regie).
+    """
+    return appointment.start_datetime, appointment.end_datetime, appointment.fingerprint
+
+
+def session_id(appointment_id, ordinal):
+    """
+    Id of the ordinal-th session sharing appointment_id.
+
+    The first session keeps appointment_id itself, so ids of days with a
+    single session at a studio are unchanged. The suffix stays within the
+    base32hex alphabet allowed in Calendar event ids.
+    """
+    return appointment_id if ordinal == 0 else f"{appointment_id}s{ordinal}"
+
+
+def session_ids(appointments):
+    """
+    Returns a unique id for each Appointment, in order, numbering sessions
+    that share an appointment_id by start time.
+    """
+    order = sorted(range(len(appointments)),
+                   key=lambda index: (appointments[index].appointment_id, session_order(appointments[index])))
+    ids = [None] * len(appointments)
+    previous, ordinal = None, 0
+    for index in order:
+        appointment_id = appointments[index].appointment_id
+        ordinal = ordinal + 1 if appointment_id == previous else 0
+        ids[index] = session_id(appointment_id, ordinal)
+        previous = appointment_id
+    return ids
+
+
+def select_future_appointments(appointments, current_date):
+    """
+    Localizes scraped appointment dicts and keeps those starting at or after current_date.
+
+    Returns:
+        List of Appointment records
+    """
+    tz = pytz.timezone(TIMEZONE)
+    future_appointments = []
+
+    for appointment in appointments:
+        record = to_appointment(appointment, tz)
+        if record.start_datetime >= current_date:
+            future_appointments.append(record)
+
+    return future_appointments
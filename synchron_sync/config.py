@@ -0,0 +1,169 @@
+"""
+Runtime configuration for the Synchron to Google Calendar sync.
+
+Credentials are read from the environment (optionally populated from a
+``credentials.env`` file) when :func:`load_config` is called, never at import
+time.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+BASE_URL = 'https://login.synchron.de'
+
+TIMEZONE = 'Europe/Berlin'
+CALENDAR_ID = 'primary'
+
+
+@dataclass
+class Config:
+    # Label used for logging and the per-account state directory
+    name: str = 'default'
+    username: Optional[str] = None
+    password: Optional[str] = None
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    refresh_token: Optional[str] = None
+    synchron_base_url: str = BASE_URL
+    calendar_id: str = CALENDAR_ID
+    # Days ahead to scrape in date ranges of synchron_range_days, fetched
+    # synchron_page_workers at a time; 0 scrapes the single events page
+    synchron_window_days: int = 0
+    synchron_range_days: int = 14
+    # Query appended to the events URL per range; {start}/{end} use synchron_range_date_format
+    synchron_range_query: str = 'start={start}&end={end}'
+    synchron_range_date_format: str = '%Y-%m-%d'
+    synchron_page_workers: int = 4
+    # A range with more pages than this fails the scrape rather than return part of it
+    synchron_max_pages: int = 20
+    pushover_token: Optional[str] = None
+    pushover_user_key: Optional[str] = None
+    telegram_bot_token: Optional[str] = None
+    telegram_chat_id: Optional[str] = None
+    # Local JSON-lines file that receives every notification, if set
+    notify_file: Optional[str] = None
+    # Up to this many changes are notified one by one, more are sent as one digest
+    notify_individual_threshold: int = 3
+    state_dir: str = '.sync_state'
+    # False for feed-only setups that never touch Google Calendar
+    google_calendar: bool = True
+    # iCalendar feed of the appointments, and the [host:]port to serve it on
+    ics_file: Optional[str] = None
+    ics_serve: Optional[str] = None
+    # Directory of the Parquet history of scraped schedules, see synchron_sync.history
+    history_dir: Optional[str] = None
+    incremental_calendar: bool = False
+    # Calendar batch requests in flight at once, requests per second (0: unlimited;
+    # the API's default quota is about 10 per user) and attempts per change
+    calendar_workers: int = 4
+    calendar_qps: float = 10.0
+    calendar_max_attempts: int = 5
+    # geopy service name (e.g. 'nominatim') for studio coordinates; None disables geocoding
+    geocoder: Optional[str] = None
+    geocoder_user_agent: str = 'synchron_calender_sync_action'
+    # Starting point for the travel time estimates on calendar events
+    home_address: Optional[str] = None
+    geocode_ttl_days: float = 30
+    # Seconds a crashed run blocks the next one (0 disables the run lease), and how
+    # long a run waits for the lease before skipping
+    lease_ttl: float = 5 * 60
+    lease_wait: float = 0
+    session_cache_key: Optional[str] = None
+    # Seconds after which a run reconciles the calendar even if Synchron is unchanged
+    full_reconcile_interval: float = 6 * 60 * 60
+    # JSON-lines file that receives the metrics of every run; None disables it
+    status_log: Optional[str] = 'status.log'
+    # node_exporter textfile collector file for the metrics of the last run
+    prometheus_textfile: Optional[str] = None
+    # Daemon polling intervals in seconds, see synchron_sync.daemon
+    poll_active_seconds: float = 5 * 60
+    poll_idle_seconds: float = 30 * 60
+    poll_recent_seconds: float = 60
+    poll_recent_window: float = 30 * 60
+    poll_max_backoff_seconds: float = 60 * 60
+    # Local hours [start, end) in which the daemon polls at the active rate
+    working_hours: Tuple[int, int] = (7, 21)
+
+    def state_path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    @property
+    def synchron_login_url(self) -> str:
+        return f"{self.synchron_base_url}/login?is_app=0"
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_hours(name: str, default: Tuple[int, int]) -> Tuple[int, int]:
+    # Parses values like '7-21'
+    value = os.getenv(name)
+    if not value:
+        return default
+    start, end = value.split('-', 1)
+    return int(start), int(end)
+
+
+def load_config(env_file: str = 'credentials.env') -> Config:
+    """
+    Builds a Config from environment variables.
+
+    Args:
+        env_file: Optional dotenv file loaded before reading the environment
+
+    Returns:
+        Config populated from the environment
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv(env_file)
+    return Config(
+        username=os.getenv('USERNAME'),
+        password=os.getenv('PASSWORD'),
+        client_id=os.getenv('CLIENT_ID'),
+        client_secret=os.getenv('CLIENT_SECRET'),
+        refresh_token=os.getenv('REFRESH_TOKEN'),
+        synchron_base_url=os.getenv('SYNCHRON_BASE_URL', BASE_URL),
+        calendar_id=os.getenv('CALENDAR_ID', CALENDAR_ID),
+        synchron_window_days=int(os.getenv('SYNCHRON_WINDOW_DAYS', '0')),
+        synchron_range_days=int(os.getenv('SYNCHRON_RANGE_DAYS', '14')),
+        synchron_range_query=os.getenv('SYNCHRON_RANGE_QUERY', 'start={start}&end={end}'),
+        synchron_range_date_format=os.getenv('SYNCHRON_RANGE_DATE_FORMAT', '%Y-%m-%d'),
+        synchron_page_workers=int(os.getenv('SYNCHRON_PAGE_WORKERS', '4')),
+        synchron_max_pages=int(os.getenv('SYNCHRON_MAX_PAGES', '20')),
+        pushover_token=os.getenv('PUSHOVER_TOKEN'),
+        pushover_user_key=os.getenv('PUSHOVER_USER_KEY'),
+        telegram_bot_token=os.getenv('TELEGRAM_BOT_TOKEN'),
+        telegram_chat_id=os.getenv('TELEGRAM_CHAT_ID'),
+        notify_file=os.getenv('NOTIFY_FILE'),
+        notify_individual_threshold=int(os.getenv('NOTIFY_INDIVIDUAL_MAX', '3')),
+        state_dir=os.getenv('SYNC_STATE_DIR', '.sync_state'),
+        google_calendar=_env_flag('GOOGLE_CALENDAR', True),
+        ics_file=os.getenv('ICS_FILE') or None,
+        ics_serve=os.getenv('ICS_SERVE') or None,
+        history_dir=os.getenv('HISTORY_DIR') or None,
+        incremental_calendar=_env_flag('CALENDAR_INCREMENTAL'),
+        calendar_workers=int(os.getenv('CALENDAR_WORKERS', '4')),
+        calendar_qps=float(os.getenv('CALENDAR_QPS', '10')),
+        calendar_max_attempts=int(os.getenv('CALENDAR_MAX_ATTEMPTS', '5')),
+        geocoder=os.getenv('GEOCODER') or None,
+        geocoder_user_agent=os.getenv('GEOCODER_USER_AGENT', 'synchron_calender_sync_action'),
+        home_address=os.getenv('HOME_ADDRESS') or None,
+        geocode_ttl_days=float(os.getenv('GEOCODE_TTL_DAYS', '30')),
+        lease_ttl=float(os.getenv('LEASE_TTL_SECONDS', '300')),
+        lease_wait=float(os.getenv('LEASE_WAIT_SECONDS', '0')),
+        session_cache_key=os.getenv('SESSION_CACHE_KEY'),
+        full_reconcile_interval=float(os.getenv('FULL_RECONCILE_HOURS', '6')) * 60 * 60,
+        status_log=os.getenv('STATUS_LOG', 'status.log') or None,
+        prometheus_textfile=os.getenv('PROMETHEUS_TEXTFILE') or None,
+        poll_active_seconds=float(os.getenv('POLL_ACTIVE_SECONDS', '300')),
+        poll_idle_seconds=float(os.getenv('POLL_IDLE_SECONDS', '1800')),
+        poll_recent_seconds=float(os.getenv('POLL_RECENT_SECONDS', '60')),
+        poll_recent_window=float(os.getenv('POLL_RECENT_WINDOW_SECONDS', '1800')),
+        poll_max_backoff_seconds=float(os.getenv('POLL_MAX_BACKOFF_SECONDS', '3600')),
+        working_hours=_env_hours('WORKING_HOURS', (7, 21)),
+    )
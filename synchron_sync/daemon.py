@@ -0,0 +1,117 @@
+"""
+Long-running sync loop.
+
+Unlike the one-shot cron run, the daemon keeps the Synchron session, the
+Calendar service and the run state in memory, and polls faster during
+working hours or shortly after a change than overnight.
+"""
+import logging
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import pytz
+
+from .config import TIMEZONE, Config, load_config
+from .notify import build_notification_bus
+from .sync import SyncResult, SyncRunner
+
+logger = logging.getLogger(__name__)
+
+# Relative random spread applied to every delay so polls don't line up
+POLL_JITTER = 0.1
+
+
+def next_poll_delay(
+    now: datetime,
+    seconds_since_change: Optional[float],
+    consecutive_failures: int,
+    config: Config,
+    rng: random.Random
+) -> float:
+    """
+    Returns the number of seconds to wait before the next sync.
+
+    Args:
+        now: Current local time
+        seconds_since_change: Time since appointments last changed, None if never
+        consecutive_failures: Number of failed runs in a row
+        config: Polling settings
+        rng: Random source for jitter
+
+    Returns:
+        Delay in seconds
+    """
+    start_hour, end_hour = config.working_hours
+    if seconds_since_change is not None and seconds_since_change < config.poll_recent_window:
+        delay = config.poll_recent_seconds
+    elif start_hour <= now.hour < end_hour:
+        delay = config.poll_active_seconds
+    else:
+        delay = config.poll_idle_seconds
+
+    if consecutive_failures:
+        delay = min(delay * 2 ** consecutive_failures, max(config.poll_max_backoff_seconds, delay))
+
+    return delay * (1 + rng.uniform(-POLL_JITTER, POLL_JITTER))
+
+
+def run_daemon(config: Optional[Config] = None) -> None:
+    """
+    Syncs until SIGTERM or SIGINT; a run in progress is finished before exiting.
+    """
+    if config is None:
+        config = load_config()
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}. Shutting down after the current run...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    tz = pytz.timezone(TIMEZONE)
+    rng = random.Random()
+    notifier = build_notification_bus(config)
+    # Backoff sleeps between login attempts end early on shutdown
+    runner = SyncRunner(config, notifier, sleep=stop.wait)
+    feed_server = None
+    if config.ics_file and config.ics_serve:
+        from .ics import FeedServer, parse_address
+
+        feed_server = FeedServer(config.ics_file, parse_address(config.ics_serve)).start()
+        logger.info(f"Serving {config.ics_file} on http://{config.ics_serve}")
+    last_change = None
+    consecutive_failures = 0
+
+    try:
+        while not stop.is_set():
+            try:
+                result = runner.run_once()
+            except Exception as e:
+                logger.warning(f"Sync run failed with error: {str(e)}")
+                result = SyncResult(success=False)
+
+            consecutive_failures = 0 if result.success else consecutive_failures + 1
+            if result.changed:
+                last_change = time.monotonic()
+
+            delay = next_poll_delay(
+                datetime.now(tz),
+                time.monotonic() - last_change if last_change is not None else None,
+                consecutive_failures,
+                config,
+                rng
+            )
+            logger.info(f"Next sync in {delay:.0f} seconds.")
+            stop.wait(delay)
+    finally:
+        if feed_server is not None:
+            feed_server.stop()
+        notifier.close()
+        logger.info("Daemon stopped.")
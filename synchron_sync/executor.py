@@ -0,0 +1,278 @@
+"""
+Applies planned Calendar mutations with bounded concurrency.
+
+The plan is split into batch requests that run on a small thread pool.
+Every sub-request takes a token from a TokenBucket first, so a run never
+sends more than the configured number of requests per second however many
+changes pile up. Sub-requests rejected for quota or server reasons (429,
+403 rateLimitExceeded, 5xx) are retried with exponential backoff and
+jitter, waiting at least as long as the Retry-After header asks.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+from . import metrics
+from .gcal import BATCH_SIZE
+from .transport import backoff_delay, build_google_http
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at rate tokens per second up to capacity.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Blocks until tokens are available and takes them.
+
+        Requests larger than the capacity are let through once the bucket is
+        full, leaving it in debt.
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+def error_status(exception: Exception) -> Optional[int]:
+    resp = getattr(exception, 'resp', None)
+    return getattr(resp, 'status', None)
+
+
+def error_reason(exception: Exception) -> str:
+    """
+    Returns the first reason of a Google API error body, e.g. 'rateLimitExceeded'.
+    """
+    content = getattr(exception, 'content', None)
+    if not content:
+        return ''
+    try:
+        body = json.loads(content)
+        return body['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ''
+
+
+def is_retryable(exception: Exception) -> bool:
+    status = error_status(exception)
+    if status is None:
+        # No HTTP response at all: connection reset, timeout, ...
+        return isinstance(exception, (OSError, TimeoutError))
+    if status in RETRYABLE_STATUSES:
+        return True
+    return status == 403 and error_reason(exception) in RATE_LIMIT_REASONS
+
+
+def retry_after(exception: Exception) -> Optional[float]:
+    """
+    Returns the Retry-After of an HttpError in seconds, if it sent one.
+    """
+    resp = getattr(exception, 'resp', None)
+    value = resp.get('retry-after') if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_failures(failures: dict) -> str:
+    """
+    Groups exceptions by status and reason, e.g. '2x 403 rateLimitExceeded, 1x 500'.
+    """
+    groups = Counter()
+    for exception in failures.values():
+        status = error_status(exception)
+        label = ' '.join(part for part in (str(status or type(exception).__name__), error_reason(exception)) if part)
+        groups[label] += 1
+    return ', '.join(f"{count}x {label}" for label, count in groups.most_common())
+
+
+class MutationExecutor:
+    """
+    Sends (request_id, HttpRequest) pairs as batch requests on a thread pool.
+
+    Args:
+        max_workers: Batch requests in flight at once
+        rate_limiter: TokenBucket shared by all requests; None disables rate limiting
+        max_attempts: Attempts per sub-request, including the first
+        base_delay: Backoff before the first retry in seconds, doubled per attempt
+        max_delay: Upper bound on the backoff
+        batch_size: Maximum number of sub-requests per batch (the API allows 50)
+    """
+
+    def __init__(self, max_workers: int = 4, rate_limiter: Optional[TokenBucket] = None,
+                 max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 64.0,
+                 batch_size: int = BATCH_SIZE, sleep: Callable[[float], None] = time.sleep,
+                 rng: Optional[random.Random] = None):
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, config) -> 'MutationExecutor':
+        rate_limiter = TokenBucket(config.calendar_qps) if config.calendar_qps > 0 else None
+        return cls(
+            max_workers=config.calendar_workers,
+            rate_limiter=rate_limiter,
+            max_attempts=config.calendar_max_attempts,
+        )
+
+    def backoff(self, attempt: int, exception: Exception) -> float:
+        """
+        Seconds to wait before retry number attempt (1-based) after exception.
+        """
+        # Jitter spreads out retries of the parallel workers
+        delay = backoff_delay(attempt - 1, self.base_delay, self.max_delay, self._rng)
+        requested = retry_after(exception)
+        return max(delay, requested) if requested is not None else delay
+
+    def execute(self, service, operations: list, on_result: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Executes operations and retries the sub-requests that failed transiently.
+
+        A failing sub-request (or a failing batch) is recorded against its own
+        request id and does not stop the others.
+
+        Args:
+            service: Calendar API service
+            operations: List of (request_id, HttpRequest) tuples; ids must be unique
+            on_result: Called with {request_id: (response, exception)} as soon as
+                the outcome of those requests is final; may run on a worker thread
+
+        Returns:
+            Dict mapping request_id to (response, exception); one of the two is None
+        """
+        chunks = [operations[start:start + self.batch_size]
+                  for start in range(0, len(operations), self.batch_size)]
+        if not chunks:
+            return {}
+
+        results = {}
+        stats = Counter()
+        if self.max_workers <= 1 or len(chunks) == 1:
+            outcomes = [self._execute_chunk(service, chunk, None, on_result) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)),
+                                    thread_name_prefix='calendar') as pool:
+                outcomes = list(pool.map(
+                    lambda chunk: self._execute_chunk(service, chunk, self._thread_http(service), on_result), chunks
+                ))
+
+        # Counters are added here because worker threads don't see the run's metrics
+        for chunk_results, chunk_stats in outcomes:
+            results.update(chunk_results)
+            stats.update(chunk_stats)
+        for name, amount in stats.items():
+            metrics.incr(name, amount)
+        return results
+
+    def _execute_chunk(self, service, chunk, http, on_result):
+        results = {}
+        stats = Counter()
+        pending = list(chunk)
+
+        for attempt in range(1, self.max_attempts + 1):
+            if self.rate_limiter is not None:
+                stats['calendar_throttle_ms'] += round(self.rate_limiter.acquire(len(pending)) * 1000)
+
+            batch_results = self._execute_batch(service, pending, http)
+            stats['calendar_requests'] += 1
+            stats['calendar_batch_items'] += len(pending)
+            results.update(batch_results)
+
+            retry = [(request_id, request) for request_id, request in pending
+                     if batch_results[request_id][1] is not None and is_retryable(batch_results[request_id][1])]
+            if attempt == self.max_attempts:
+                retry = []
+            if on_result is not None:
+                retry_ids = {request_id for request_id, _ in retry}
+                on_result({request_id: result for request_id, result in batch_results.items()
+                           if request_id not in retry_ids})
+            if not retry:
+                break
+
+            delay = max(self.backoff(attempt, batch_results[request_id][1]) for request_id, _ in retry)
+            logger.info(f"Retrying {len(retry)} calendar changes in {delay:.1f}s "
+                        f"({summarize_failures({request_id: batch_results[request_id][1] for request_id, _ in retry})})")
+            stats['calendar_retries'] += len(retry)
+            self._sleep(delay)
+            pending = retry
+
+        return results, stats
+
+    def _execute_batch(self, service, operations, http):
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in operations:
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute(http=http)
+        except Exception as e:
+            logger.warning(f"Batch request failed: {e}")
+            for request_id, _ in operations:
+                results.setdefault(request_id, (None, e))
+        for request_id, _ in operations:
+            results.setdefault(request_id, (None, RuntimeError('No response in batch')))
+        return results
+
+    def _thread_http(self, service):
+        # httplib2 connections are not thread-safe, so each worker gets its own
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import google_auth_httplib2
+
+            http = build_google_http()
+            if isinstance(service._http, google_auth_httplib2.AuthorizedHttp):
+                http = google_auth_httplib2.AuthorizedHttp(service._http.credentials, http=http)
+            self._local.http = http
+        return http
@@ -0,0 +1,360 @@
+"""
+Google Calendar access.
+
+The Google client libraries are slow to import, so they are only loaded from
+:func:`authenticate_google_api` once a run actually needs the Calendar.
+"""
+import hashlib
+import logging
+import weakref
+from datetime import datetime
+
+import pytz
+from dateutil import parser
+
+from . import metrics
+from .appointments import content_fingerprint, session_id
+from .config import CALENDAR_ID, TIMEZONE
+from .state import load_state, save_state
+from .transport import build_google_http, build_session
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on sub-requests per Calendar API batch request
+BATCH_SIZE = 50
+
+PAGE_SIZE = 250
+# googleapiclient retries list pages on 429/5xx and connection errors with jittered backoff
+LIST_RETRIES = 2
+
+# Only the event fields that needs_update and process_calendar_events read
+EVENT_FIELDS = 'id,status,summary,description,location,start,end,extendedProperties'
+LIST_FIELDS = f'nextPageToken,nextSyncToken,items({EVENT_FIELDS})'
+
+# service.events() rebuilds every method of the resource on each call
+_events_resources = weakref.WeakKeyDictionary()
+
+
+def events_resource(service):
+    """
+    Returns service.events(), built once per service.
+    """
+    resource = _events_resources.get(service)
+    if resource is None:
+        resource = _events_resources[service] = service.events()
+    return resource
+
+
+def authenticate_google_api(config, token_cache=None):
+    """
+    Builds the Calendar service.
+
+    The access token is kept in token_cache (an EncryptedStateFile) and
+    reused until shortly before it expires, and the service is built from the
+    discovery document bundled with google-api-python-client, so a warm run
+    makes no auth or discovery requests before its first API call.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    logger.info("Authenticating Google Calendar API...")
+    # A token minted for another refresh token (e.g. after rotating secrets) is ignored
+    owner = hashlib.sha256((config.refresh_token or '').encode('utf-8')).hexdigest()
+    cached = token_cache.load(default={}) if token_cache is not None else {}
+    token = None
+    expiry = None
+    if cached.get('owner') == owner and cached.get('token'):
+        token = cached['token']
+        # google-auth compares expiry as a naive UTC datetime
+        expiry = datetime.fromisoformat(cached['expiry'])
+
+    creds = Credentials(
+        token,
+        refresh_token=config.refresh_token,
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=config.client_id,
+        client_secret=config.client_secret,
+        scopes=['https://www.googleapis.com/auth/calendar'],
+        expiry=expiry
+    )
+
+    # Credentials.valid already treats tokens close to expiry as expired
+    if not creds.valid:
+        logger.info("Refreshing Google access token...")
+        metrics.incr('oauth_refreshes')
+        creds.refresh(Request(session=build_session()))
+        if token_cache is not None and creds.expiry is not None:
+            token_cache.save({
+                'token': creds.token,
+                'expiry': creds.expiry.isoformat(),
+                'owner': owner,
+            })
+
+    http = AuthorizedHttp(creds, http=build_google_http())
+    service = build('calendar', 'v3', http=http, static_discovery=True, cache_discovery=False)
+    return service
+
+
+def _list_event_pages(service, calendar_id=CALENDAR_ID, **params):
+    """
+    Yields every page of an events().list call, following nextPageToken.
+    """
+    page_token = None
+    while True:
+        metrics.incr('calendar_requests')
+        page = events_resource(service).list(
+            calendarId=calendar_id,
+            pageToken=page_token,
+            maxResults=PAGE_SIZE,
+            fields=LIST_FIELDS,
+            **params
+        ).execute(num_retries=LIST_RETRIES)
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def start_of_today():
+    """
+    Local midnight of the current day.
+
+    Sessions sharing an appointment_id are all on the same day, so listing
+    from here shows every event whose id a new session could collide with.
+    """
+    tz = pytz.timezone(TIMEZONE)
+    return tz.localize(datetime.combine(datetime.now(tz).date(), datetime.min.time()))
+
+
+def fetch_future_events(service, time_max=None, calendar_id=CALENDAR_ID):
+    """
+    Lists the script-created events from the start of today on.
+
+    Args:
+        service: Calendar API service
+        time_max: Aware datetime; events starting at or after it are left
+            out. SyncRunner passes the horizon of a date-windowed scrape, so
+            events beyond it are never planned for deletion.
+        calendar_id: Calendar to list
+
+    Returns:
+        Events ordered by start time
+    """
+    logger.info("Fetching future events from Google Calendar...")
+    params = {
+        'timeMin': start_of_today().isoformat(),
+        'privateExtendedProperty': 'createdBySynchronScript=true',
+        'singleEvents': True,
+        'orderBy': 'startTime',
+    }
+    if time_max is not None:
+        params['timeMax'] = time_max.isoformat()
+
+    events = []
+    for page in _list_event_pages(service, calendar_id, **params):
+        events.extend(page.get('items', []))
+
+    logger.info(f"Fetched {len(events)} events.")
+    return events
+
+
+def fetch_future_events_incremental(service, state_path, time_max=None, calendar_id=CALENDAR_ID):
+    """
+    Like fetch_future_events, but keeps a local copy of the script-created
+    events and only downloads what changed since the stored syncToken.
+
+    The Calendar API refuses timeMin/timeMax/privateExtendedProperty together
+    with sync tokens, so filtering happens locally: the local copy keeps every
+    future event and time_max only narrows what is returned. An expired token
+    (HTTP 410) triggers a full resync.
+    """
+    from googleapiclient.errors import HttpError
+
+    state = load_state(state_path) or {}
+    sync_token = state.get('sync_token')
+    events_by_id = state.get('events', {}) if sync_token else {}
+
+    try:
+        if sync_token:
+            logger.info("Fetching changed events from Google Calendar...")
+        else:
+            logger.info("Running full Google Calendar sync...")
+        sync_token = _apply_event_pages(service, events_by_id, sync_token, calendar_id)
+    except HttpError as e:
+        if e.resp.status != 410:
+            raise
+        logger.info("Calendar sync token expired. Running full Google Calendar sync...")
+        events_by_id = {}
+        sync_token = _apply_event_pages(service, events_by_id, None, calendar_id)
+
+    # Events of earlier days can no longer be reconciled, so they are not worth keeping
+    today = start_of_today()
+    starts = {event_id: parser.isoparse(event['start']['dateTime']) for event_id, event in events_by_id.items()}
+    events_by_id = {event_id: event for event_id, event in events_by_id.items() if starts[event_id] >= today}
+    save_state(state_path, {'sync_token': sync_token, 'events': events_by_id})
+
+    events = [
+        event for event_id, event in events_by_id.items()
+        if time_max is None or starts[event_id] < time_max
+    ]
+    events.sort(key=lambda event: starts[event['id']])
+
+    logger.info(f"Fetched {len(events)} events.")
+    return events
+
+
+def _apply_event_pages(service, events_by_id, sync_token, calendar_id=CALENDAR_ID):
+    """
+    Merges listed events into events_by_id and returns the next sync token.
+    """
+    # Script events never recur; expanding the calendar's other recurring
+    # events would only add instances to every full and token-based listing
+    params = {'singleEvents': False}
+    if sync_token:
+        params['syncToken'] = sync_token
+
+    next_sync_token = None
+    for page in _list_event_pages(service, calendar_id, **params):
+        for event in page.get('items', []):
+            if event.get('status') == 'cancelled' or not _is_script_event(event):
+                events_by_id.pop(event['id'], None)
+            else:
+                events_by_id[event['id']] = event
+        next_sync_token = page.get('nextSyncToken', next_sync_token)
+    return next_sync_token
+
+
+def _is_script_event(event):
+    private = event.get('extendedProperties', {}).get('private', {})
+    return private.get('createdBySynchronScript') == 'true' and 'dateTime' in event.get('start', {})
+
+
+def build_event_body(appointment, location=None):
+    """
+    Calendar event body for appointment; location (a geo.StudioLocation) adds
+    the studio's coordinates and travel time to the private properties.
+    """
+    body = {
+        'summary': appointment.studio_name,
+        'location': appointment.address,
+        'description': appointment.regie,
+        'start': {
+            'dateTime': appointment.start_datetime.isoformat(),
+            'timeZone': TIMEZONE,
+        },
+        'end': {
+            'dateTime': appointment.end_datetime.isoformat(),
+            'timeZone': TIMEZONE,
+        },
+        'extendedProperties': {
+            'private': {
+                'createdBySynchronScript': 'true',
+                'appointment_id': appointment.appointment_id,
+                'fingerprint': appointment.fingerprint
+            }
+        }
+    }
+    if location is not None:
+        body['extendedProperties']['private'].update(location.event_properties())
+    return body
+
+
+def calendar_event_id(appointment_id, ordinal=0):
+    """
+    Returns the client-supplied Calendar event id for the ordinal-th session
+    sharing appointment_id.
+
+    Event ids may contain the characters a-v and 0-9, so the hex digest from
+    generate_appointment_id is used as is, with a session suffix from the
+    same alphabet. A replayed insert then fails with 409 instead of creating
+    a second event.
+    """
+    return session_id(appointment_id, ordinal)
+
+
+def create_google_calendar_event(service, body, calendar_id=CALENDAR_ID):
+    """
+    Returns an unexecuted insert request for the event body.
+    """
+    return events_resource(service).insert(calendarId=calendar_id, body=body)
+
+
+def get_google_calendar_event(service, event_id, calendar_id=CALENDAR_ID):
+    """
+    Returns an unexecuted get request for event_id; deleted events are returned with status 'cancelled'.
+    """
+    return events_resource(service).get(calendarId=calendar_id, eventId=event_id, fields=EVENT_FIELDS)
+
+
+def update_google_calendar_event(service, event_id, body, calendar_id=CALENDAR_ID):
+    """
+    Returns an unexecuted update request replacing event_id with the event body.
+    """
+    return events_resource(service).update(calendarId=calendar_id, eventId=event_id, body=body)
+
+
+def delete_google_calendar_event(service, event_id, calendar_id=CALENDAR_ID):
+    """
+    Returns an unexecuted delete request for event_id.
+    """
+    return events_resource(service).delete(calendarId=calendar_id, eventId=event_id)
+
+
+def needs_update(event, appointment):
+    """
+    True if event does not show appointment's current details.
+
+    An event whose stored fingerprint matches, and whose listed fields hash
+    to the same fingerprint in their raw string form, is up to date without
+    parsing anything. Any other event, whether edited by hand, created
+    before fingerprints existed or listed with another UTC offset format,
+    is compared field by field. Such events may still show the current
+    details, see fingerprint_outdated.
+    """
+    private = event.get('extendedProperties', {}).get('private', {})
+    if private.get('fingerprint') == appointment.fingerprint and event_fingerprint(event) == appointment.fingerprint:
+        return False
+
+    tz = pytz.timezone(TIMEZONE)
+    event_start = parser.isoparse(event['start']['dateTime']).astimezone(tz)
+    event_end = parser.isoparse(event['end']['dateTime']).astimezone(tz)
+
+    current_regie = event.get('description', '').strip()
+    new_regie = appointment.regie.strip()
+
+    logger.debug(f"Checking if event {appointment.appointment_id} needs update:")
+
+    return (
+        event_start != appointment.start_datetime or
+        event_end != appointment.end_datetime or
+        event.get('location', '') != appointment.address or
+        event.get('summary', '') != appointment.studio_name or
+        current_regie != new_regie
+    )
+
+
+def event_fingerprint(event):
+    """
+    content_fingerprint of the summary, location, description and times event itself shows.
+    """
+    return content_fingerprint(
+        event['start']['dateTime'], event['end']['dateTime'], event.get('location', ''),
+        event.get('description', ''), event.get('summary', ''),
+    )
+
+
+def fingerprint_outdated(event, appointment):
+    """
+    True if event lacks appointment's fingerprint or carries a stale one.
+    """
+    return event.get('extendedProperties', {}).get('private', {}).get('fingerprint') != appointment.fingerprint
+
+
+def location_outdated(event, location):
+    """
+    True if event lacks location's coordinates or travel time, or shows stale ones.
+    """
+    private = event.get('extendedProperties', {}).get('private', {})
+    return any(private.get(name) != value for name, value in location.event_properties().items())
@@ -0,0 +1,242 @@
+"""
+Studio location enrichment: coordinates and travel time from home.
+
+Lookups are keyed on (studio_name, address) and kept in an on-disk cache
+with a TTL and LRU eviction, so the few dozen studios that keep coming back
+are geocoded once a month rather than on every run. Cache misses of a run
+are deduplicated and looked up together, spaced by a rate limiter that
+respects the geocoding service's usage policy.
+
+The geocoder is any object with a geocode(query) method returning a
+GeoPoint or None; GeopyGeocoder wraps a geopy provider.
+"""
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from .executor import TokenBucket
+from .state import load_state, save_state
+
+logger = logging.getLogger(__name__)
+
+# Nominatim allows one request per second
+DEFAULT_GEOCODE_RATE = 1.0
+# Straight-line distance times DETOUR_FACTOR at AVERAGE_SPEED_KMH approximates city driving
+DETOUR_FACTOR = 1.3
+AVERAGE_SPEED_KMH = 30.0
+
+
+@dataclass(frozen=True)
+class GeoPoint:
+    latitude: float
+    longitude: float
+    # Address as the geocoder normalized it
+    address: str = ''
+
+
+@dataclass(frozen=True)
+class StudioLocation:
+    point: GeoPoint
+    travel_minutes: Optional[int] = None
+
+    def event_properties(self) -> dict:
+        """
+        Private extended properties describing the location on a calendar event.
+        """
+        properties = {
+            'latitude': f"{self.point.latitude:.6f}",
+            'longitude': f"{self.point.longitude:.6f}",
+        }
+        if self.travel_minutes is not None:
+            properties['travel_minutes'] = str(self.travel_minutes)
+        return properties
+
+
+def location_key(studio_name: str, address: str) -> str:
+    return f"{studio_name.strip()}|{address.strip()}"
+
+
+def distance_km(a: GeoPoint, b: GeoPoint) -> float:
+    # Haversine distance; accurate to well under a kilometre at city scale
+    lat1, lon1, lat2, lon2 = map(math.radians, (a.latitude, a.longitude, b.latitude, b.longitude))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def estimate_travel_minutes(origin: GeoPoint, destination: GeoPoint,
+                            speed_kmh: float = AVERAGE_SPEED_KMH) -> int:
+    return round(distance_km(origin, destination) * DETOUR_FACTOR / speed_kmh * 60)
+
+
+class GeopyGeocoder:
+    """
+    Geocodes with a geopy provider, Nominatim (OpenStreetMap) by default.
+    """
+
+    def __init__(self, user_agent: str, provider: str = 'nominatim', timeout: float = 10):
+        from geopy.geocoders import get_geocoder_for_service
+
+        self._geocoder = get_geocoder_for_service(provider)(user_agent=user_agent, timeout=timeout)
+
+    def geocode(self, query: str) -> Optional[GeoPoint]:
+        location = self._geocoder.geocode(query)
+        if location is None:
+            return None
+        return GeoPoint(location.latitude, location.longitude, location.address)
+
+
+class GeoCache:
+    """
+    JSON file of geocoding results with a TTL and LRU eviction.
+
+    Addresses the geocoder could not find are cached too, so they are not
+    asked for again until the TTL runs out.
+    """
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 60 * 60, max_entries: int = 500,
+                 clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = load_state(path) or {}
+        self._dirty = False
+        self._evict()
+
+    def get(self, key: str) -> Tuple[bool, Optional[GeoPoint]]:
+        """
+        Returns (hit, point); point is None for a cached miss.
+        """
+        entry = self._entries.get(key)
+        now = self._clock()
+        if entry is None or now - entry['stored'] > self.ttl:
+            return False, None
+        # Kept in memory only; it reaches the file with the next added entry
+        entry['used'] = now
+        if entry['point'] is None:
+            return True, None
+        return True, GeoPoint(*entry['point'])
+
+    def put(self, key: str, point: Optional[GeoPoint]) -> None:
+        now = self._clock()
+        self._entries[key] = {
+            'point': [point.latitude, point.longitude, point.address] if point is not None else None,
+            'stored': now,
+            'used': now,
+        }
+        self._dirty = True
+        self._evict()
+
+    def save(self) -> None:
+        """
+        Writes the cache file if an entry was added or evicted since the last save.
+        """
+        if not self._dirty:
+            return
+        save_state(self.path, self._entries)
+        self._dirty = False
+
+    def _evict(self) -> None:
+        now = self._clock()
+        entries = {key: entry for key, entry in self._entries.items() if now - entry['stored'] <= self.ttl}
+        if len(entries) > self.max_entries:
+            recent = sorted(entries, key=lambda key: entries[key]['used'], reverse=True)[:self.max_entries]
+            entries = {key: entries[key] for key in recent}
+        if len(entries) != len(self._entries):
+            self._entries = entries
+            self._dirty = True
+
+
+class LocationEnricher:
+    """
+    Resolves studio locations through a GeoCache, geocoding only cache misses.
+
+    Args:
+        geocoder: Object with geocode(query) -> Optional[GeoPoint]
+        cache: GeoCache for results
+        home: Starting point for travel times; None leaves them out
+        rate_limiter: Spaces the geocoder calls; defaults to one per second
+        max_lookups: Upper bound on geocoder calls per run, the rest waits for the next run
+    """
+
+    def __init__(self, geocoder, cache: GeoCache, home: Optional[GeoPoint] = None,
+                 rate_limiter: Optional[TokenBucket] = None, max_lookups: int = 20):
+        self.geocoder = geocoder
+        self.cache = cache
+        self.home = home
+        self.rate_limiter = rate_limiter or TokenBucket(DEFAULT_GEOCODE_RATE, capacity=1)
+        self.max_lookups = max_lookups
+
+    def geocode(self, query: str, key: Optional[str] = None) -> Optional[GeoPoint]:
+        """
+        Looks up a single query through the cache.
+        """
+        return self.lookup({key or query: query}).get(key or query)
+
+    def lookup(self, queries: Dict[str, str]) -> Dict[str, Optional[GeoPoint]]:
+        """
+        Resolves {key: query} pairs, calling the geocoder once per uncached key.
+        """
+        results = {}
+        misses = {}
+        for key, query in queries.items():
+            hit, point = self.cache.get(key)
+            if hit:
+                results[key] = point
+            else:
+                misses[key] = query
+
+        if len(misses) > self.max_lookups:
+            logger.info(f"Geocoding {self.max_lookups} of {len(misses)} new addresses this run.")
+        for key, query in list(misses.items())[:self.max_lookups]:
+            self.rate_limiter.acquire()
+            try:
+                point = self.geocoder.geocode(query)
+            except Exception as e:
+                # Not cached, so the address is tried again next run
+                logger.warning(f"Geocoding '{query}' failed: {e}")
+                continue
+            self.cache.put(key, point)
+            results[key] = point
+
+        self.cache.save()
+        return results
+
+    def enrich(self, appointments: Iterable) -> Dict[str, StudioLocation]:
+        """
+        Returns the locations of the appointments' studios, keyed by location_key.
+
+        Studios that could not be geocoded are left out.
+        """
+        queries = {}
+        for appointment in appointments:
+            key = location_key(appointment.studio_name, appointment.address)
+            queries.setdefault(key, appointment.address or appointment.studio_name)
+
+        locations = {}
+        for key, point in self.lookup(queries).items():
+            if point is None:
+                continue
+            travel_minutes = estimate_travel_minutes(self.home, point) if self.home is not None else None
+            locations[key] = StudioLocation(point, travel_minutes)
+        return locations
+
+
+def build_enricher(config) -> Optional[LocationEnricher]:
+    """
+    Creates a LocationEnricher for config, or None if geocoding is off.
+    """
+    if not config.geocoder:
+        return None
+    geocoder = GeopyGeocoder(config.geocoder_user_agent, config.geocoder)
+    enricher = LocationEnricher(
+        geocoder,
+        GeoCache(config.state_path('geocode_cache.json'), ttl=config.geocode_ttl_days * 24 * 60 * 60),
+    )
+    if config.home_address:
+        enricher.home = enricher.geocode(config.home_address, key='home|' + config.home_address)
+        if enricher.home is None:
+            logger.warning("Could not geocode HOME_ADDRESS; travel times are left out.")
+    return enricher
@@ -0,0 +1,221 @@
+"""
+Columnar history of the scraped schedules.
+
+Every run whose appointments differ from the last recorded snapshot appends
+them as one Parquet file to a month partition (month=YYYY-MM). Runs that
+scraped the same set are not stored again, so a year of 15-minute polling
+only keeps the snapshots in which something changed. Once a partition has
+collected COMPACT_PARTS files they are merged into one, which keeps reads
+fast and the dictionary-encoded, zstd-compressed columns small.
+
+Queries read only the requested columns of the month partitions that
+overlap the requested time range.
+"""
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from .appointments import session_ids, to_appointment
+from .state import load_state, save_state
+
+logger = logging.getLogger(__name__)
+
+# session_id tells apart sessions sharing an appointment_id, see reconcile.SessionIds
+COLUMNS = ('snapshot', 'digest', 'appointment_id', 'session_id', 'start', 'end', 'studio_name', 'address', 'regie',
+           'fingerprint')
+# Parts in a month partition that trigger a merge into a single file
+COMPACT_PARTS = 32
+# Files starting with '_' or '.' are skipped by the Parquet dataset reader
+LATEST_FILE = '_latest.json'
+
+
+def _month(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m')
+
+
+class HistoryStore:
+    """
+    Month-partitioned Parquet snapshots of the scraped appointments.
+
+    An empty snapshot is stored as a single row without appointment_id, so
+    the times at which Synchron showed no appointments are kept as well.
+    """
+
+    def __init__(self, root: str, compact_parts: int = COMPACT_PARTS):
+        self.root = root
+        self.compact_parts = compact_parts
+
+    def latest_digest(self) -> Optional[str]:
+        return (load_state(os.path.join(self.root, LATEST_FILE)) or {}).get('digest')
+
+    def append(self, appointments, digest: str, taken: Optional[float] = None,
+               ids: Optional[List[str]] = None) -> bool:
+        """
+        Stores appointments as a snapshot unless the last one had the same digest.
+
+        Args:
+            appointments: Scraped appointment dicts
+            digest: appointments_digest of appointments
+            taken: Snapshot time as a Unix timestamp, now if omitted
+            ids: Session id of each appointment, from reconcile.SessionIds;
+                sessions are numbered by start time if omitted
+
+        Returns:
+            True if a snapshot was written
+        """
+        if digest == self.latest_digest():
+            return False
+        import pandas as pd
+
+        taken = time.time() if taken is None else taken
+        records = [to_appointment(appointment) for appointment in appointments]
+        rows = []
+        for appointment, session in zip(records, ids or session_ids(records)):
+            rows.append((appointment.appointment_id, session, appointment.start_datetime, appointment.end_datetime,
+                         appointment.studio_name, appointment.address, appointment.regie, appointment.fingerprint))
+        if not rows:
+            rows.append((None,) * (len(COLUMNS) - 2))
+
+        frame = pd.DataFrame(rows, columns=COLUMNS[2:])
+        frame['start'] = pd.to_datetime(frame['start'], utc=True)
+        frame['end'] = pd.to_datetime(frame['end'], utc=True)
+        frame.insert(0, 'snapshot', pd.Timestamp(taken, unit='s', tz='UTC'))
+        frame.insert(1, 'digest', digest)
+
+        month = _month(taken)
+        partition = os.path.join(self.root, f'month={month}')
+        self._write(frame, os.path.join(partition, f'{int(taken * 1000)}-{digest[:12]}.parquet'))
+        save_state(os.path.join(self.root, LATEST_FILE), {'digest': digest, 'taken': taken})
+        logger.info(f"Recorded a snapshot of {len(appointments)} appointments in the history.")
+
+        parts = [name for name in os.listdir(partition) if name.endswith('.parquet')]
+        if len(parts) >= self.compact_parts:
+            self.compact(month)
+        return True
+
+    def compact(self, month: str) -> None:
+        """
+        Merges the files of a month partition into one.
+        """
+        import pandas as pd
+
+        partition = os.path.join(self.root, f'month={month}')
+        parts = sorted(os.path.join(partition, name) for name in os.listdir(partition) if name.endswith('.parquet'))
+        if len(parts) < 2:
+            return
+        # A compaction interrupted after writing its output leaves duplicates behind
+        frame = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+        frame = frame.drop_duplicates(subset=['snapshot', 'session_id']).sort_values('snapshot', kind='stable')
+        self._write(frame, os.path.join(partition, f'compacted-{int(time.time() * 1000)}.parquet'))
+        for part in parts:
+            os.remove(part)
+        logger.debug(f"Compacted {len(parts)} history files of {month}.")
+
+    def months(self) -> List[str]:
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(name.split('=', 1)[1] for name in names if name.startswith('month='))
+
+    def load(self, columns: Optional[Sequence[str]] = None, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, include_empty: bool = False):
+        """
+        Reads snapshots taken in [start, end) as a DataFrame.
+
+        Args:
+            columns: Columns to read (see COLUMNS); all of them if omitted
+            start: Earliest snapshot time, timezone-aware
+            end: Snapshot time to stop before, timezone-aware
+            include_empty: Keep the rows marking empty snapshots
+
+        Returns:
+            DataFrame sorted by snapshot
+        """
+        import pandas as pd
+
+        columns = list(columns or COLUMNS)
+        read_columns = columns + [name for name in ('snapshot', 'appointment_id') if name not in columns]
+        first = _month(start.timestamp()) if start is not None else None
+        last = _month(end.timestamp() - 1e-6) if end is not None else None
+        months = [month for month in self.months()
+                  if (first is None or month >= first) and (last is None or month <= last)]
+        if not months:
+            return pd.DataFrame(columns=columns)
+
+        frame = pd.read_parquet(
+            self.root, engine='pyarrow', columns=read_columns, filters=[('month', 'in', months)],
+        )
+        mask = pd.Series(True, index=frame.index) if include_empty else frame['appointment_id'].notna()
+        if start is not None:
+            mask &= frame['snapshot'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= frame['snapshot'] < pd.Timestamp(end)
+        frame = frame[mask].sort_values('snapshot', kind='stable')
+        return frame[columns].reset_index(drop=True)
+
+    def first_seen(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Returns when each appointment first appeared, indexed by session_id.
+        """
+        frame = self.load(['session_id', 'studio_name', 'start', 'snapshot'], start, end)
+        return frame.groupby('session_id', sort=False).first().rename(columns={'snapshot': 'first_seen'})
+
+    def studio_changes(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Counts per studio how often appointments were rescheduled or cancelled.
+
+        A reschedule is a change of an appointment's start or end between
+        consecutive snapshots; a cancellation is an appointment that vanished
+        from the schedule before it started.
+
+        Returns:
+            DataFrame indexed by studio_name with 'appointments', 'rescheduled'
+            and 'cancelled' columns
+        """
+        import pandas as pd
+
+        frame = self.load(['snapshot', 'session_id', 'studio_name', 'start', 'end'], start, end, include_empty=True)
+        # Empty snapshots belong on the timeline: they are when the last appointments vanished
+        snapshots = frame['snapshot'].drop_duplicates().sort_values().reset_index(drop=True)
+        frame = frame[frame['session_id'].notna()]
+        columns = ['appointments', 'rescheduled', 'cancelled']
+        if frame.empty:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name='studio_name'))
+
+        by_appointment = frame.groupby('session_id', sort=False)
+        previous_start = by_appointment['start'].shift()
+        previous_end = by_appointment['end'].shift()
+        frame['rescheduled'] = previous_start.notna() & (
+            (frame['start'] != previous_start) | (frame['end'] != previous_end)
+        )
+
+        last = by_appointment.agg(last_seen=('snapshot', 'max'), start=('start', 'last'),
+                                  studio_name=('studio_name', 'last'))
+        # The first snapshot after the last one listing the appointment
+        following = snapshots.searchsorted(last['last_seen'], side='right')
+        # Positions past the last snapshot become NaT; reindexing keeps the timezone even then
+        vanished_at = snapshots.reindex(following).set_axis(last.index)
+        last['cancelled'] = vanished_at.notna() & (vanished_at < last['start'])
+
+        result = pd.DataFrame({
+            'appointments': last.groupby('studio_name').size(),
+            'rescheduled': frame.groupby('studio_name')['rescheduled'].sum(),
+            'cancelled': last.groupby('studio_name')['cancelled'].sum(),
+        })
+        return result.fillna(0).astype(int)[columns]
+
+    def _write(self, frame, path: str) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.parquet')
+        os.close(fd)
+        try:
+            frame.to_parquet(tmp_path, engine='pyarrow', index=False, compression='zstd')
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
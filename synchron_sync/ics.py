@@ -0,0 +1,229 @@
+"""
+iCalendar (.ics) feed of the scraped appointments.
+
+An alternative to the Google Calendar sync for users who subscribe to a
+calendar URL: the feed is regenerated only when the appointment digest
+changes, written atomically, and optionally served over HTTP with an ETag
+so polling clients get a 304 while nothing changed.
+"""
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+from .appointments import session_ids, to_appointment
+from .state import save_bytes
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//synchron_calender_sync_action//Synchron appointments//DE'
+UID_DOMAIN = 'synchron-sync'
+# Digest of the appointments a feed was rendered from, kept in the file itself
+DIGEST_PROPERTY = 'X-SYNCHRON-DIGEST'
+CACHE_CONTROL = 'max-age=60'
+
+
+def _escape(text: str) -> str:
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: lines longer than 75 octets continue on lines starting with a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74
+    return '\r\n '.join(parts)
+
+
+def _utc(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_calendar(appointments, digest: str = '', name: str = 'Synchron',
+                    uids: Optional[List[str]] = None) -> str:
+    """
+    Renders scraped appointment dicts as an iCalendar document.
+
+    Event UIDs are the appointments' session ids, so calendar clients keep
+    tracking an appointment across feed updates. Pass the ids from
+    reconcile.SessionIds as uids to keep them stable when other sessions of
+    the same day change; without them sessions are numbered by start time.
+    """
+    stamp = _utc(datetime.now(timezone.utc))
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+        f'{DIGEST_PROPERTY}:{digest}',
+    ]
+    records = [to_appointment(appointment) for appointment in appointments]
+    for appointment, uid in zip(records, uids or session_ids(records)):
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:{uid}@{UID_DOMAIN}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{_utc(appointment.start_datetime)}',
+            f'DTEND:{_utc(appointment.end_datetime)}',
+            f'SUMMARY:{_escape(appointment.studio_name)}',
+            f'LOCATION:{_escape(appointment.address)}',
+        ]
+        if appointment.regie:
+            lines.append(f'DESCRIPTION:{_escape(appointment.regie)}')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+class IcsFeed:
+    """
+    An .ics file that is rewritten only when the appointments change.
+    """
+
+    def __init__(self, path: str, name: str = 'Synchron'):
+        self.path = path
+        self.name = name
+        self._digest = None
+
+    def current_digest(self) -> Optional[str]:
+        """
+        Returns the digest the file on disk was rendered from, if any.
+        """
+        if self._digest is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                    header = []
+                    for line in f:
+                        if line.startswith('BEGIN:VEVENT'):
+                            break
+                        header.append(line)
+            except OSError:
+                return None
+            # Undo line folding before looking for the property
+            for line in ''.join(header).replace('\r\n ', '').splitlines():
+                if line.startswith(DIGEST_PROPERTY + ':'):
+                    self._digest = line.split(':', 1)[1]
+        return self._digest
+
+    def update(self, appointments, digest: str, uids: Optional[List[str]] = None) -> bool:
+        """
+        Writes the feed unless it was already rendered from digest; see
+        render_calendar for uids.
+
+        Returns:
+            True if the file was rewritten
+        """
+        if digest == self.current_digest():
+            return False
+        save_bytes(self.path, render_calendar(appointments, digest, self.name, uids).encode('utf-8'))
+        self._digest = digest
+        logger.info(f"Wrote {len(appointments)} appointments to {self.path}.")
+        return True
+
+
+class FeedServer:
+    """
+    Serves one .ics file over HTTP with ETag/If-None-Match revalidation.
+
+    The file is read and hashed again only when its mtime or size changes.
+    """
+
+    def __init__(self, path: str, address: Tuple[str, int] = ('127.0.0.1', 8080)):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cached = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+            def do_GET(self):
+                server._respond(self, send_body=True)
+
+            def do_HEAD(self):
+                server._respond(self, send_body=False)
+
+        self._httpd = ThreadingHTTPServer(address, Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    def start(self) -> 'FeedServer':
+        """
+        Serves on a background thread.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='ics-feed', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _load(self):
+        stat = os.stat(self.path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._cached is None or self._cached[0] != key:
+                with open(self.path, 'rb') as f:
+                    body = f.read()
+                etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+                self._cached = (key, body, etag, formatdate(stat.st_mtime, usegmt=True))
+            return self._cached[1:]
+
+    def _respond(self, handler: BaseHTTPRequestHandler, send_body: bool) -> None:
+        try:
+            body, etag, last_modified = self._load()
+        except OSError:
+            handler.send_error(404, 'Feed not written yet')
+            return
+
+        if_none_match = handler.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.send_header('Cache-Control', CACHE_CONTROL)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.send_header('ETag', etag)
+        handler.send_header('Last-Modified', last_modified)
+        handler.send_header('Cache-Control', CACHE_CONTROL)
+        handler.end_headers()
+        if send_body:
+            handler.wfile.write(body)
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    """
+    Parses '8080', ':8080' or 'host:8080'; the host defaults to 127.0.0.1.
+    """
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
@@ -0,0 +1,116 @@
+"""
+Write-ahead journal of planned calendar changes.
+
+Before a run applies its inserts, updates and deletes, the plan is written
+to an append-only JSON-lines file; every change is then marked done as soon
+as its response comes back. If the process dies in between, the next run
+applies only the changes that were never confirmed instead of recomputing
+the plan. Inserts carry client-supplied event ids, so replaying an insert
+whose response was lost is answered with 409 instead of creating a
+duplicate.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from .state import save_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingPlan:
+    """
+    The unfinished part of a journaled plan.
+    """
+    calendar_id: str
+    # Digest of the Synchron appointments the plan was computed from
+    digest: Optional[str]
+    created: float
+    operations: List[dict] = field(default_factory=list)
+
+
+class Journal:
+    """
+    Append-only journal in a single file.
+
+    The first line holds the plan; each following line lists request ids
+    that were applied. A torn last line from a crash is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def begin(self, operations: List[dict], calendar_id: str, digest: Optional[str]) -> None:
+        """
+        Replaces the journal with a new plan.
+
+        Args:
+            operations: JSON-serializable operations, each with a unique 'request_id'
+            calendar_id: Calendar the operations apply to
+            digest: Digest of the appointments the plan was computed from
+        """
+        line = json.dumps({
+            'plan': {'calendar_id': calendar_id, 'digest': digest, 'created': time.time()},
+            'operations': operations,
+        }, ensure_ascii=False)
+        with self._lock:
+            save_bytes(self.path, (line + '\n').encode('utf-8'))
+
+    def mark_done(self, request_ids: Iterable[str]) -> None:
+        """
+        Records request_ids as applied and forces the record to disk.
+        """
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'done': request_ids}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def pending(self) -> Optional[PendingPlan]:
+        """
+        Returns the operations of the journaled plan that were not marked done,
+        or None if there is no journal or everything in it was applied.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.debug(f"Ignoring unreadable journal line in {self.path}")
+        if not records or 'plan' not in records[0]:
+            return None
+
+        done = set()
+        for record in records[1:]:
+            done.update(record.get('done', []))
+
+        plan = records[0]['plan']
+        operations = [operation for operation in records[0]['operations'] if operation['request_id'] not in done]
+        if not operations:
+            return None
+        return PendingPlan(plan['calendar_id'], plan.get('digest'), plan.get('created', 0), operations)
+
+    def finish(self) -> None:
+        """
+        Removes the journal once its plan has been worked through.
+        """
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
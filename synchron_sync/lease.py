@@ -0,0 +1,172 @@
+"""
+Run lease that keeps overlapping invocations from syncing the same account.
+
+A lease names its owner and expires ttl seconds after it was last renewed.
+While a run holds it, a heartbeat thread renews it every ttl / 3 seconds,
+so a slow run keeps its lease while a crashed one loses it after at most
+ttl seconds and the next invocation takes over.
+
+Leases live in a LeaseStore. FileLeaseStore keeps them in lock files and
+works for every process on one machine; a store shared between machines
+only needs the same acquire/renew/release compare-and-set methods.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from .state import load_state, save_state
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 5 * 60
+
+
+class FileLeaseStore:
+    """
+    Leases stored as JSON files in a directory.
+
+    Each read-modify-write happens under an flock on a companion .lock
+    file, so two processes that find the same stale lease cannot both take
+    it over.
+    """
+
+    def __init__(self, directory: str, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self._clock = clock
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.lease')
+
+    @contextmanager
+    def _guard(self, name: str):
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(name) + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Takes the lease if it is free, expired or already owned by owner.
+        """
+        path = self._path(name)
+        with self._guard(name):
+            now = self._clock()
+            current = load_state(path)
+            if current and current['owner'] != owner:
+                if current['expires'] > now:
+                    return False
+                logger.warning(f"Taking over lease '{name}' from {current['owner']}, "
+                               f"expired {now - current['expires']:.0f} seconds ago.")
+            save_state(path, {'owner': owner, 'expires': now + ttl})
+            return True
+
+    def renew(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Extends the lease if owner still holds it.
+        """
+        path = self._path(name)
+        with self._guard(name):
+            current = load_state(path)
+            if not current or current['owner'] != owner:
+                return False
+            save_state(path, {'owner': owner, 'expires': self._clock() + ttl})
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        path = self._path(name)
+        with self._guard(name):
+            current = load_state(path)
+            if current and current['owner'] == owner:
+                os.remove(path)
+
+
+class RunLease:
+    """
+    A lease on one named resource, held with a background heartbeat.
+
+    Args:
+        store: LeaseStore keeping the lease
+        name: Resource the lease protects
+        ttl: Seconds the lease stays valid without a heartbeat
+        sleep: Waits between acquisition attempts; a true return value, as
+            from a set threading.Event's wait, means shutdown and ends them
+    """
+
+    def __init__(self, store, name: str, ttl: float = DEFAULT_TTL,
+                 sleep: Callable[[float], Optional[bool]] = time.sleep):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._sleep = sleep
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._heartbeat = None
+
+    @property
+    def lost(self) -> bool:
+        """
+        True once a heartbeat found the lease taken over by someone else.
+        """
+        return self._lost.is_set()
+
+    def acquire(self, wait: float = 0.0, poll_interval: float = 5.0) -> bool:
+        """
+        Takes the lease, trying for up to wait seconds, and starts the heartbeat.
+
+        Returns:
+            False if another owner still holds the lease, or shutdown was
+            requested while waiting for it
+        """
+        deadline = time.monotonic() + wait
+        while not self.store.acquire(self.name, self.owner, self.ttl):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._sleep(min(poll_interval, remaining)):
+                return False
+
+        self._stop.clear()
+        self._lost.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name=f'lease-{self.name}', daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def release(self) -> None:
+        if self._heartbeat is None:
+            return
+        self._stop.set()
+        self._heartbeat.join()
+        self._heartbeat = None
+        if not self.lost:
+            self.store.release(self.name, self.owner)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.store.renew(self.name, self.owner, self.ttl)
+            except Exception as e:
+                # The lease is still valid for a while; try again on the next beat
+                logger.warning(f"Failed to renew lease '{self.name}': {e}")
+                continue
+            if not renewed:
+                logger.error(f"Lease '{self.name}' was taken over by another run.")
+                self._lost.set()
+                return
+
+
+def run_lease(config, sleep: Callable[[float], Optional[bool]] = time.sleep) -> Optional[RunLease]:
+    """
+    Returns the lease guarding config's account, or None if leases are disabled.
+    """
+    if config.lease_ttl <= 0:
+        return None
+    return RunLease(FileLeaseStore(config.state_dir), 'sync', config.lease_ttl, sleep)
@@ -0,0 +1,137 @@
+"""
+Per-run timing spans and counters.
+
+SyncRunner activates a RunMetrics for the duration of a run; code anywhere
+below it records into the active one through the module-level span() and
+incr() helpers, which do nothing outside a run. At the end of the run the
+metrics are appended as a JSON line to the status log and/or written to a
+Prometheus textfile.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from .state import save_bytes
+
+_current: ContextVar[Optional['RunMetrics']] = ContextVar('run_metrics', default=None)
+_status_log_lock = threading.Lock()
+_textfile_lock = threading.Lock()
+# Latest (started, to_dict()) of each account per Prometheus textfile path
+_textfile_runs = {}
+
+
+class RunMetrics:
+    def __init__(self, account: str):
+        self.account = account
+        self.started = time.time()
+        self.spans = {}
+        self.counters = Counter()
+        self.success = None
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Adds the time spent in the with-block to the span called name.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - t0
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def to_dict(self) -> dict:
+        return {
+            'time': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'account': self.account,
+            'success': self.success,
+            'duration': round(time.time() - self.started, 4),
+            'spans': {name: round(seconds, 4) for name, seconds in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+
+@contextmanager
+def collect(metrics: RunMetrics):
+    """
+    Makes metrics the target of span() and incr() inside the with-block.
+    """
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def span(name: str):
+    metrics = _current.get()
+    return metrics.span(name) if metrics is not None else nullcontext()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, amount)
+
+
+def instrument_session(session) -> None:
+    """
+    Counts requests and response bytes of a requests.Session in the active run.
+    """
+    session.hooks['response'].append(_count_response)
+
+
+def _count_response(response, *args, **kwargs):
+    incr('http_requests')
+    incr('http_bytes', len(response.content))
+
+
+def write_status_line(metrics: RunMetrics, path: str) -> None:
+    line = json.dumps(metrics.to_dict(), sort_keys=True) + '\n'
+    with _status_log_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+
+def write_prometheus_textfile(metrics: RunMetrics, path: str) -> None:
+    """
+    Writes the run in the node_exporter textfile collector format.
+
+    Accounts synced by one process may share the file, so it is rewritten
+    with the latest run of every account written to path so far.
+    """
+    with _textfile_lock:
+        runs = _textfile_runs.setdefault(path, {})
+        runs[metrics.account] = (metrics.started, metrics.to_dict())
+        families = {
+            'synchron_sync_last_run_timestamp_seconds': [],
+            'synchron_sync_last_run_success': [],
+            'synchron_sync_last_run_duration_seconds': [],
+            'synchron_sync_phase_duration_seconds': [],
+            'synchron_sync_last_run_count': [],
+        }
+        for account, (started, data) in sorted(runs.items()):
+            label = f'account="{_escape_label(account)}"'
+            families['synchron_sync_last_run_timestamp_seconds'].append(f'{{{label}}} {started:.3f}')
+            families['synchron_sync_last_run_success'].append(f'{{{label}}} {1 if data["success"] else 0}')
+            families['synchron_sync_last_run_duration_seconds'].append(f'{{{label}}} {data["duration"]}')
+            for name, seconds in sorted(data['spans'].items()):
+                families['synchron_sync_phase_duration_seconds'].append(f'{{{label},phase="{name}"}} {seconds}')
+            for name, value in sorted(data['counters'].items()):
+                families['synchron_sync_last_run_count'].append(f'{{{label},counter="{name}"}} {value}')
+
+        lines = []
+        for family, samples in families.items():
+            lines.append(f'# TYPE {family} gauge')
+            lines.extend(family + sample for sample in samples)
+        save_bytes(path, ('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
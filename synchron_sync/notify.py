@@ -0,0 +1,222 @@
+"""
+Notifications for calendar changes.
+
+Changes are published to a NotificationBus during a run and delivered to
+every sink (Pushover, Telegram, a local file) on a background worker once
+the run flushes the bus. Many changes are merged into one digest message
+per sink.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import requests
+
+from . import metrics
+from .transport import build_session
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_TIMEOUT = 10
+
+
+@dataclass
+class Notification:
+    title: str
+    message: str
+    priority: int = 0
+
+
+class PushoverSink:
+    """
+    Sends notifications through Pushover over a pooled session.
+    Priority: -2 to 2 (-2 is lowest, 2 is highest/emergency)
+    """
+    name = 'pushover'
+    max_message_length = 1024
+
+    def __init__(self, token: str, user_key: str, session: Optional[requests.Session] = None):
+        self.token = token
+        self.user_key = user_key
+        self.session = session or build_session()
+
+    def send(self, notification: Notification) -> None:
+        payload = {
+            'token': self.token,
+            'user': self.user_key,
+            'title': notification.title,
+            'message': notification.message,
+            'priority': notification.priority,
+            'sound': 'pushover'
+        }
+        response = self.session.post(
+            'https://api.pushover.net/1/messages.json',
+            data=payload,
+            timeout=NOTIFY_TIMEOUT
+        )
+        if response.status_code != 200:
+            raise RuntimeError(response.text)
+
+
+class TelegramSink:
+    """
+    Sends notifications to a Telegram chat with python-telegram-bot.
+    """
+    name = 'telegram'
+    max_message_length = 4096
+
+    def __init__(self, bot_token: str, chat_id: str):
+        from telegram import Bot
+        from telegram.utils.request import Request
+
+        self.bot = Bot(bot_token, request=Request(con_pool_size=2, connect_timeout=NOTIFY_TIMEOUT,
+                                                  read_timeout=NOTIFY_TIMEOUT))
+        self.chat_id = chat_id
+
+    def send(self, notification: Notification) -> None:
+        self.bot.send_message(
+            chat_id=self.chat_id,
+            text=f"{notification.title}\n\n{notification.message}",
+            disable_notification=notification.priority < 0,
+        )
+
+
+class FileSink:
+    """
+    Appends notifications as JSON lines to a local file.
+    """
+    name = 'file'
+    max_message_length = None
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, notification: Notification) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'time': time.time(),
+                'title': notification.title,
+                'message': notification.message,
+                'priority': notification.priority,
+            }, ensure_ascii=False) + '\n')
+
+
+class NotificationBus:
+    """
+    Collects the notifications of a run and delivers them off the calling thread.
+
+    Args:
+        sinks: Objects with a send(Notification) method
+        individual_threshold: Up to this many notifications are sent one by
+            one; more are merged into a single digest per sink
+    """
+
+    def __init__(self, sinks: list, individual_threshold: int = 3):
+        self.sinks = sinks
+        self.individual_threshold = individual_threshold
+        self._pending: List[Notification] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notify')
+
+    def publish(self, title: str, message: str, priority: int = 0) -> None:
+        metrics.incr('notified')
+        self._pending.append(Notification(title, message, priority))
+
+    def flush(self) -> None:
+        """
+        Hands the notifications published so far to the background worker.
+        """
+        pending, self._pending = self._pending, []
+        if pending and self.sinks:
+            # _deliver logs its own failures and close() waits on the executor,
+            # so a long-running daemon keeps no reference to finished batches
+            self._executor.submit(self._deliver, pending)
+
+    def close(self) -> None:
+        """
+        Flushes and waits until the background worker has delivered everything.
+        """
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _deliver(self, notifications: List[Notification]) -> None:
+        if len(notifications) <= self.individual_threshold:
+            outgoing = notifications
+        else:
+            outgoing = [merge_notifications(notifications)]
+
+        for sink in self.sinks:
+            for notification in outgoing:
+                try:
+                    sink.send(_truncate(notification, sink.max_message_length))
+                    logger.info(f"Sent {sink.name} notification: {notification.title}")
+                except Exception as e:
+                    logger.warning(f"Failed to send {sink.name} notification: {e}")
+
+
+def merge_notifications(notifications: List[Notification]) -> Notification:
+    """
+    Combines notifications into one digest carrying the highest priority.
+    """
+    return Notification(
+        title=f"{len(notifications)} appointment changes",
+        message='\n\n'.join(notification.message for notification in notifications),
+        priority=max(notification.priority for notification in notifications),
+    )
+
+
+def _truncate(notification: Notification, max_length: Optional[int]) -> Notification:
+    if max_length is None or len(notification.message) <= max_length:
+        return notification
+    return Notification(notification.title, notification.message[:max_length - 1] + '…', notification.priority)
+
+
+def build_notification_bus(config, session: Optional[requests.Session] = None) -> NotificationBus:
+    """
+    Creates a NotificationBus with every sink that config has credentials for.
+
+    Args:
+        config: Sink credentials and settings
+        session: Optional session shared with other buses for HTTP sinks
+    """
+    sinks = []
+    if config.pushover_token and config.pushover_user_key:
+        sinks.append(PushoverSink(config.pushover_token, config.pushover_user_key, session))
+    if config.telegram_bot_token and config.telegram_chat_id:
+        sinks.append(TelegramSink(config.telegram_bot_token, config.telegram_chat_id))
+    if config.notify_file:
+        sinks.append(FileSink(config.notify_file))
+    return NotificationBus(sinks, individual_threshold=config.notify_individual_threshold)
+
+
+def format_notification_message(appointment, action="added"):
+    """
+    Format the notification message for an appointment.
+    """
+    message = (
+        f"Appointment {action}:\n"
+        f"Studio: {appointment.studio_name}\n"
+        f"Date: {appointment.date}\n"
+        f"Time: {appointment.start_time} - {appointment.end_time}\n"
+        f"Location: {appointment.address}"
+    )
+
+    if appointment.regie:  # Add regie information if available
+        message += f"\nRegie: {appointment.regie}"
+
+    return message
+
+
+def format_notification_message_from_key(key, action="cancelled"):
+    date, start_time, studio_name, regie = key
+    message = (
+        f"Appointment {action}:\n"
+        f"Studio: {studio_name}\n"
+        f"Date: {date}\n"
+        f"Time: {start_time}"
+    )
+    if regie:
+        message += f"\nRegie: {regie}"
+    return message
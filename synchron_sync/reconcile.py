@@ -0,0 +1,160 @@
+"""
+Pairs scraped appointments with the script's calendar events.
+
+appointment_id covers date, studio and regie only, so a morning and an
+afternoon session at the same studio share it. Both sides are sorted by
+(appointment_id, start, end) and merged in one pass; within a group of
+equal ids, sessions are paired with the event showing exactly their
+content (same fingerprint) first and the remaining ones by start time.
+Sessions left over are inserted with the lowest session id not used by
+any known event, events left over are deleted. Sorting is the only
+superlinear step, and the merge looks at every appointment and event once.
+
+SessionIds applies the same pairing to the previous scrape, giving the ICS
+feed and the history session ids that survive changes to other sessions.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from dateutil import parser
+
+from .appointments import session_order, to_appointment
+from .gcal import calendar_event_id
+from .state import load_state, save_state
+
+
+@dataclass
+class Reconciliation:
+    # (appointment, event) pairs; the event may need an update
+    matched: List[Tuple[object, dict]] = field(default_factory=list)
+    # (appointment, event id to create it with)
+    inserts: List[Tuple[object, str]] = field(default_factory=list)
+    # (event start, event) of events without an appointment
+    deletes: List[Tuple[object, dict]] = field(default_factory=list)
+
+
+def event_appointment_id(event) -> str:
+    return event.get('extendedProperties', {}).get('private', {}).get('appointment_id', '')
+
+
+def pair_sessions(appointments, events, reserved_ids=frozenset()) -> Reconciliation:
+    """
+    Pairs appointments with events in one sort-merge pass.
+
+    Args:
+        appointments: Appointment records
+        events: (start, event) pairs of script-created events, start being the
+            event's parsed start time and event carrying an appointment_id
+        reserved_ids: Ids of further existing events, such as sessions that
+            already started today, which new sessions must not reuse
+
+    Returns:
+        Reconciliation with every appointment and event in exactly one list
+    """
+    scraped = sorted(appointments, key=lambda appointment: (appointment.appointment_id, session_order(appointment)))
+    listed = sorted(
+        events, key=lambda item: (event_appointment_id(item[1]), item[0], item[1]['end']['dateTime'], item[1]['id'])
+    )
+
+    result = Reconciliation()
+    i = j = 0
+    while i < len(scraped) or j < len(listed):
+        if j == len(listed) or (i < len(scraped) and scraped[i].appointment_id < event_appointment_id(listed[j][1])):
+            key = scraped[i].appointment_id
+        else:
+            key = event_appointment_id(listed[j][1])
+
+        group_start = i
+        while i < len(scraped) and scraped[i].appointment_id == key:
+            i += 1
+        event_group_start = j
+        while j < len(listed) and event_appointment_id(listed[j][1]) == key:
+            j += 1
+        _pair_group(key, scraped[group_start:i], listed[event_group_start:j], reserved_ids, result)
+
+    return result
+
+
+def _pair_group(appointment_id, appointments, events, reserved_ids, result: Reconciliation) -> None:
+    # Groups hold the sessions of one studio on one day, so they are tiny
+    by_fingerprint = {}
+    for index, (_, event) in enumerate(events):
+        fingerprint = event.get('extendedProperties', {}).get('private', {}).get('fingerprint')
+        by_fingerprint.setdefault(fingerprint, []).append(index)
+
+    paired = set()
+    unmatched = []
+    for appointment in appointments:
+        candidates = by_fingerprint.get(appointment.fingerprint)
+        if candidates:
+            index = candidates.pop(0)
+            paired.add(index)
+            result.matched.append((appointment, events[index][1]))
+        else:
+            unmatched.append(appointment)
+
+    remaining = [item for index, item in enumerate(events) if index not in paired]
+    for appointment, (_, event) in zip(unmatched, remaining):
+        result.matched.append((appointment, event))
+    result.deletes.extend(remaining[len(unmatched):])
+
+    new_sessions = unmatched[len(remaining):]
+    if not new_sessions:
+        return
+    # Ids of events being deleted stay taken: reusing one would race the delete
+    taken = {event['id'] for _, event in events} | set(reserved_ids)
+    ordinal = 0
+    for appointment in new_sessions:
+        while calendar_event_id(appointment_id, ordinal) in taken:
+            ordinal += 1
+        event_id = calendar_event_id(appointment_id, ordinal)
+        taken.add(event_id)
+        result.inserts.append((appointment, event_id))
+
+
+class SessionIds:
+    """
+    Session ids of scraped appointments that stay put from one scrape to the next.
+
+    The sessions of the previous scrape are kept in a JSON file and paired
+    with the new appointments like calendar events are, so cancelling the
+    morning session of a day leaves the afternoon session's id alone, and a
+    rescheduled session keeps its id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def assign(self, appointments) -> List[str]:
+        """
+        Returns the session id of each scraped appointment dict, in order.
+        """
+        previous = load_state(self.path) or {}
+        events = [
+            (parser.isoparse(session['start']), {
+                'id': session_id,
+                'end': {'dateTime': session['end']},
+                'extendedProperties': {'private': {
+                    'appointment_id': session['appointment_id'], 'fingerprint': session['fingerprint'],
+                }},
+            })
+            for session_id, session in previous.items()
+        ]
+        records = [to_appointment(appointment) for appointment in appointments]
+        reconciliation = pair_sessions(records, events)
+
+        ids_by_record = {id(appointment): event['id'] for appointment, event in reconciliation.matched}
+        ids_by_record.update((id(appointment), event_id) for appointment, event_id in reconciliation.inserts)
+        ids = [ids_by_record[id(record)] for record in records]
+        sessions = {
+            session_id: {
+                'appointment_id': record.appointment_id,
+                'start': record.start_datetime.isoformat(),
+                'end': record.end_datetime.isoformat(),
+                'fingerprint': record.fingerprint,
+            }
+            for record, session_id in zip(records, ids)
+        }
+        if sessions != previous:
+            save_state(self.path, sessions)
+        return ids
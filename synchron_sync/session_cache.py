@@ -0,0 +1,50 @@
+"""
+Encrypted on-disk cache of Synchron session cookies.
+
+Reusing the cookies of the previous run skips the CSRF page and the login
+POST whenever the Synchron session is still alive.
+"""
+import requests
+
+from .state import EncryptedStateFile
+
+
+class SessionCache:
+    """
+    Stores the cookies of a requests.Session in a Fernet-encrypted file.
+    """
+
+    def __init__(self, state_file: EncryptedStateFile):
+        self._file = state_file
+
+    def load(self, session: requests.Session) -> bool:
+        """
+        Adds the cached cookies to session.
+
+        Returns:
+            True if any cookies were restored
+        """
+        cookies = self._file.load(default=[])
+        for cookie in cookies:
+            session.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie['domain'],
+                path=cookie['path'],
+                expires=cookie['expires'],
+                secure=cookie['secure'],
+            )
+        return bool(cookies)
+
+    def save(self, session: requests.Session) -> None:
+        self._file.save([
+            {
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'expires': cookie.expires,
+                'secure': cookie.secure,
+            }
+            for cookie in session.cookies
+        ])
@@ -0,0 +1,77 @@
+"""
+Small state files kept between runs.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+
+
+def load_state(path, default=None):
+    """
+    Returns the JSON document stored at path, or default if it is missing or unreadable.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_state(path, data):
+    """
+    Writes data as JSON to path, replacing the previous file atomically.
+    """
+    save_bytes(path, json.dumps(data).encode('utf-8'))
+
+
+def save_bytes(path, data):
+    """
+    Writes data to path via a temporary file and rename, so readers never see a partial file.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class EncryptedStateFile:
+    """
+    A JSON state file encrypted with Fernet, for cookies and tokens.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        from cryptography.fernet import Fernet
+
+        self.path = path
+        self._fernet = Fernet(key)
+
+    @classmethod
+    def from_secret(cls, path: str, secret: str, salt: bytes):
+        """
+        Builds a file whose encryption key is derived from secret.
+        """
+        derived = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), salt, 100_000)
+        return cls(path, base64.urlsafe_b64encode(derived))
+
+    def load(self, default=None):
+        """
+        Returns the decrypted document, or default if it is missing or cannot be decrypted.
+        """
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(self._fernet.decrypt(f.read()))
+        except (OSError, ValueError, InvalidToken):
+            return default
+
+    def save(self, data) -> None:
+        save_bytes(self.path, self._fernet.encrypt(json.dumps(data).encode('utf-8')))
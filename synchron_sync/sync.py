@@ -0,0 +1,611 @@
+"""
+One sync run: scrape Synchron once, then reconcile the Google Calendar.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+import pytz
+from dateutil import parser
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .appointments import appointments_digest, select_future_appointments
+from .config import CALENDAR_ID, TIMEZONE, Config, load_config
+from .gcal import (
+    authenticate_google_api,
+    build_event_body,
+    calendar_event_id,
+    create_google_calendar_event,
+    delete_google_calendar_event,
+    fetch_future_events,
+    fetch_future_events_incremental,
+    fingerprint_outdated,
+    get_google_calendar_event,
+    location_outdated,
+    needs_update,
+    update_google_calendar_event,
+)
+from .executor import MutationExecutor, error_status, summarize_failures
+from .geo import build_enricher, location_key
+from .journal import Journal, PendingPlan
+from .lease import run_lease
+from .reconcile import SessionIds, event_appointment_id, pair_sessions
+from .notify import (
+    NotificationBus,
+    build_notification_bus,
+    format_notification_message,
+    format_notification_message_from_key,
+)
+from .session_cache import SessionCache
+from .state import EncryptedStateFile, load_state, save_state
+from .synchron import PageValidators, events_window, login_with_retry
+from .transport import POOL_MAXSIZE, CircuitBreaker, build_adapter, build_session
+
+logger = logging.getLogger(__name__)
+
+ACTION_COUNTERS = {'insert': 'created', 'update': 'updated', 'delete': 'deleted'}
+# Session ids an insert tries after its own is taken by another session
+MAX_SESSION_PROBES = 10
+
+
+@dataclass
+class SyncResult:
+    success: bool
+    # True if the scraped appointments differ from the previous run
+    changed: bool = False
+
+
+class SyncRunner:
+    """
+    Runs syncs for one account, keeping the Synchron session, the Calendar
+    service and the run state in memory between runs.
+
+    Runners for different accounts may share one http_adapter so their
+    Synchron sessions draw from the same connection pool, and one breaker so
+    they all back off while Synchron is down.
+    """
+
+    def __init__(self, config: Config, notifier: NotificationBus,
+                 http_adapter: Optional[HTTPAdapter] = None, breaker: Optional[CircuitBreaker] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.config = config
+        self.notifier = notifier
+        # Cookies stay on the session; only the connection pool may be shared
+        # Date-windowed scraping fetches up to synchron_page_workers pages at once
+        self.session = build_session(
+            http_adapter or build_adapter(pool_maxsize=max(POOL_MAXSIZE, config.synchron_page_workers))
+        )
+        metrics.instrument_session(self.session)
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.lease = run_lease(config, sleep)
+        self.window = events_window(config)
+        self.session_cache = make_session_cache(config)
+        self.service = None
+        # Kept between daemon runs so the rate limit spans them
+        self.executor = MutationExecutor.from_config(config)
+        self.journal = Journal(config.state_path('journal.jsonl'))
+        # Built on first use, since it may geocode the home address
+        self.enricher = None
+        self.feed = None
+        if config.ics_file:
+            from .ics import IcsFeed
+
+            self.feed = IcsFeed(config.ics_file)
+        self.history = None
+        if config.history_dir:
+            from .history import HistoryStore
+
+            self.history = HistoryStore(config.history_dir)
+        # Session ids of the feed and history, kept stable across scrapes
+        self.sessions = SessionIds(config.state_path('sessions.json'))
+        self.run_state_path = config.state_path('run_state.json')
+        self.run_state = load_state(self.run_state_path) or {}
+
+    def calendar_service(self):
+        if self.service is None:
+            self.service = authenticate_google_api(
+                self.config, encrypted_state_file(self.config, 'google_token.bin')
+            )
+        return self.service
+
+    def studio_locations(self, appointments) -> dict:
+        """
+        Returns the studios' locations keyed by geo.location_key, or {} if
+        geocoding is off or fails; enrichment never stops a sync.
+        """
+        try:
+            if self.enricher is None:
+                self.enricher = build_enricher(self.config)
+                if self.enricher is None:
+                    return {}
+            return self.enricher.enrich(appointments)
+        except Exception as e:
+            logger.warning(f"Studio location lookup failed: {e}")
+            return {}
+
+    def run_once(self) -> SyncResult:
+        """
+        Runs a single Synchron to Google Calendar sync.
+
+        If the scraped appointments are the same as at the last successful
+        reconcile, the run stops before Google is contacted, unless a full
+        reconcile is due (config.full_reconcile_interval).
+
+        Phase timings and counters of the run are written to the status log
+        and/or Prometheus textfile named in config.
+        """
+        run_metrics = metrics.RunMetrics(self.config.name)
+        try:
+            with metrics.collect(run_metrics), run_metrics.span('total'):
+                result = self._run_leased()
+            run_metrics.success = result.success
+            return result
+        finally:
+            self._write_metrics(run_metrics)
+
+    def _write_metrics(self, run_metrics: metrics.RunMetrics) -> None:
+        try:
+            if self.config.status_log:
+                metrics.write_status_line(run_metrics, self.config.status_log)
+            if self.config.prometheus_textfile:
+                metrics.write_prometheus_textfile(run_metrics, self.config.prometheus_textfile)
+        except OSError as e:
+            logger.warning(f"Failed to write run metrics: {e}")
+
+    def _run_leased(self) -> SyncResult:
+        # Overlapping invocations would both insert every new appointment
+        if self.lease is None:
+            return self._run_once()
+        if not self.lease.acquire(self.config.lease_wait):
+            logger.info("Another sync of this account is still running. Skipping this run.")
+            metrics.incr('lease_busy')
+            return SyncResult(success=True)
+        try:
+            return self._run_once()
+        finally:
+            self.lease.release()
+
+    def _lease_lost(self) -> bool:
+        if self.lease is not None and self.lease.lost:
+            logger.warning("Lost the run lease. Leaving the calendar to the run that took it over.")
+            return True
+        return False
+
+    def _run_once(self) -> SyncResult:
+        config = self.config
+        run_state = self.run_state
+
+        logger.info("Starting sync run...")
+
+        now = time.time()
+        reconcile_due = now - run_state.get('last_reconcile', 0) >= config.full_reconcile_interval
+
+        # A conditional request is only useful when the previous digest may be reused
+        validators = PageValidators()
+        if not reconcile_due and run_state.get('digest'):
+            validators.etag = run_state.get('etag')
+            validators.last_modified = run_state.get('last_modified')
+
+        today = datetime.now(pytz.timezone(TIMEZONE)).date()
+        with metrics.span('synchron'):
+            login_success, appointments = login_with_retry(
+                session=self.session,
+                base_url=config.synchron_base_url,
+                login_url=config.synchron_login_url,
+                username=config.username,
+                password=config.password,
+                max_retries=3,
+                retry_delay=5,
+                session_cache=self.session_cache,
+                validators=validators,
+                breaker=self.breaker,
+                sleep=self.sleep,
+                window=self.window,
+                today=today
+            )
+
+        if not login_success:
+            logger.warning("Failed to login after all retry attempts.")
+            return SyncResult(success=False)
+
+        digest = run_state['digest'] if validators.not_modified else appointments_digest(appointments)
+        changed = digest != run_state.get('digest')
+
+        def remember_run(last_reconcile):
+            self.run_state = {
+                'digest': digest,
+                'etag': validators.etag,
+                'last_modified': validators.last_modified,
+                'last_reconcile': last_reconcile,
+            }
+            save_state(self.run_state_path, self.run_state)
+
+        session_ids = None
+        if (self.feed is not None or self.history is not None) and appointments is not None:
+            session_ids = self.sessions.assign(appointments)
+
+        if self.feed is not None and appointments is not None:
+            with metrics.span('ics'):
+                self.feed.update(appointments, digest, session_ids)
+
+        if self.history is not None and appointments is not None:
+            with metrics.span('history'):
+                try:
+                    self.history.append(appointments, digest, taken=now, ids=session_ids)
+                except Exception as e:
+                    # The history is a by-product; it must not fail the sync
+                    logger.warning(f"Failed to record the schedule history: {e}")
+
+        if not config.google_calendar:
+            remember_run(now)
+            return SyncResult(success=True, changed=changed)
+
+        pending = self.journal.pending()
+        if not changed and not reconcile_due and pending is None:
+            logger.info("Appointments unchanged since last sync. Skipping calendar operations.")
+            remember_run(run_state['last_reconcile'])
+            return SyncResult(success=True)
+
+        if pending is not None and self._resume(pending) and pending.digest == digest:
+            # The interrupted run's plan was computed from these same appointments
+            logger.info("Resumed the interrupted sync; calendar is up to date.")
+            remember_run(now)
+            return SyncResult(success=True, changed=changed)
+
+        if appointments is None:
+            # Validators are only sent while no reconcile is due, so this is an
+            # unfinished resume or one planned from other appointments
+            logger.info("Schedule not modified, but the interrupted sync is not complete. "
+                        "Reconciling on the next run.")
+            remember_run(0)
+            return SyncResult(success=True, changed=changed)
+
+        if not appointments:
+            logger.info("No appointments found.")
+            remember_run(now)
+            return SyncResult(success=True, changed=changed)
+
+        for appointment in appointments:
+            logger.debug(f"Appointment: {appointment['date']}, {appointment['start_time']} - {appointment['end_time']}, {appointment['studio_name']}, {appointment['address']}, {appointment['regie']}")
+
+        current_date = datetime.now(pytz.timezone(TIMEZONE))
+        future_appointments = select_future_appointments(appointments, current_date)
+
+        # Only talk to Google if there is something to reconcile against
+        if not future_appointments:
+            logger.info("No future appointments found. Skipping calendar operations.")
+            remember_run(now)
+            return SyncResult(success=True, changed=changed)
+
+        with metrics.span('google_auth'):
+            service = self.calendar_service()
+        # Events past the scraped window were not checked against Synchron and must not be deleted
+        time_max = None
+        if self.window is not None:
+            time_max = pytz.timezone(TIMEZONE).localize(
+                datetime.combine(self.window.horizon(today), datetime.min.time())
+            )
+        with metrics.span('calendar_list'):
+            if config.incremental_calendar:
+                future_events = fetch_future_events_incremental(
+                    service, config.state_path('calendar_sync.json'), time_max, config.calendar_id
+                )
+            else:
+                future_events = fetch_future_events(service, time_max, config.calendar_id)
+        with metrics.span('geocode'):
+            locations = self.studio_locations(future_appointments)
+        if self._lease_lost():
+            return SyncResult(success=False, changed=changed)
+        with metrics.span('calendar_mutations'):
+            failures = process_calendar_events(
+                service, future_appointments, future_events, current_date, self.notifier, config.calendar_id,
+                self.executor, self.journal, digest, locations
+            )
+        self.notifier.flush()
+
+        # Failed changes must be retried, so only a clean run counts as reconciled
+        if not failures:
+            remember_run(now)
+        return SyncResult(success=True, changed=changed)
+
+    def _resume(self, pending: PendingPlan) -> bool:
+        """
+        Applies the operations an interrupted run journaled but never confirmed.
+
+        Returns:
+            True if all of them were applied
+        """
+        if self._lease_lost():
+            return False
+        logger.info(f"Resuming {len(pending.operations)} calendar changes of an interrupted run...")
+        with metrics.span('google_auth'):
+            service = self.calendar_service()
+        with metrics.span('calendar_resume'):
+            failures = apply_plan(
+                service, pending.operations, self.notifier, pending.calendar_id, self.executor, self.journal
+            )
+        self.notifier.flush()
+        return not failures
+
+
+def run_sync(config: Optional[Config] = None, notifier: Optional[NotificationBus] = None) -> bool:
+    """
+    Runs a single Synchron to Google Calendar sync.
+
+    Args:
+        config: Credentials to use; read from the environment when omitted
+        notifier: Bus for change notifications; a bus built from config is
+            created and closed when omitted
+
+    Returns:
+        False if the Synchron login failed, True otherwise
+    """
+    if config is None:
+        config = load_config()
+
+    if notifier is not None:
+        return SyncRunner(config, notifier).run_once().success
+
+    notifier = build_notification_bus(config)
+    try:
+        return SyncRunner(config, notifier).run_once().success
+    finally:
+        notifier.close()
+
+
+def encrypted_state_file(config: Config, name: str) -> Optional[EncryptedStateFile]:
+    """
+    Returns an encrypted file in the state directory, keyed by SESSION_CACHE_KEY or derived from the login.
+    """
+    path = config.state_path(name)
+    if config.session_cache_key:
+        return EncryptedStateFile(path, config.session_cache_key.encode('ascii'))
+    if config.username and config.password:
+        return EncryptedStateFile.from_secret(path, f"{config.username}:{config.password}", name.encode('utf-8'))
+    return None
+
+
+def make_session_cache(config: Config) -> Optional[SessionCache]:
+    state_file = encrypted_state_file(config, 'synchron_session.bin')
+    return SessionCache(state_file) if state_file is not None else None
+
+
+def process_calendar_events(service, future_appointments, future_events, current_date, notifier,
+                            calendar_id=CALENDAR_ID, executor=None, journal=None, digest=None, locations=None):
+    """
+    Plans inserts, updates and deletes and applies them with a MutationExecutor.
+
+    With a journal, the plan is written to it before anything is sent, so an
+    interrupted run can be resumed with apply_plan.
+
+    Returns:
+        Dict mapping each failed event id to its exception
+    """
+    operations = plan_calendar_changes(future_appointments, future_events, current_date, locations)
+    if not operations:
+        logger.info("Calendar is up to date.")
+        return {}
+
+    if journal is not None:
+        journal.begin(operations, calendar_id, digest)
+    return apply_plan(service, operations, notifier, calendar_id, executor, journal)
+
+
+def plan_calendar_changes(future_appointments, future_events, current_date, locations=None):
+    """
+    Compares appointments with the script's future calendar events.
+
+    Appointments are paired with events by reconcile.pair_sessions, so
+    several sessions at one studio on the same day each keep their own event.
+    locations maps geo.location_key(studio_name, address) to the studio's
+    StudioLocation; events missing their studio's location are updated.
+
+    Returns:
+        List of JSON-serializable operations with request_id ('<action>:<event_id>'),
+        action, event_id, body and the notification to publish once applied
+    """
+    locations = locations or {}
+    # Each event's start is parsed once and reused for cancellation notices
+    events = []
+    # Sessions that already started are left alone, but their ids stay taken
+    started_ids = set()
+    for event in future_events:
+        if not event_appointment_id(event):
+            continue
+        event_start = parser.isoparse(event['start']['dateTime'])
+        if event_start >= current_date:
+            events.append((event_start, event))
+        else:
+            started_ids.add(event['id'])
+
+    reconciliation = pair_sessions(future_appointments, events, started_ids)
+    operations = []
+
+    # Only delete events if we successfully fetched new appointments
+    for event_start, event in reconciliation.deletes:
+        key = (event_start.strftime('%d.%m.%Y'), event_start.strftime('%H:%M'),
+               event.get('summary', ''), event.get('description', ''))
+        operations.append(_operation(
+            'delete', event['id'], None,
+            "Appointment Cancelled", format_notification_message_from_key(key, action="cancelled"),
+        ))
+
+    for appointment, event in reconciliation.matched:
+        location = locations.get(location_key(appointment.studio_name, appointment.address))
+        if needs_update(event, appointment):
+            logger.debug(f"Update required for: {appointment.studio_name} on {appointment.date}")
+            operations.append(_operation(
+                'update', event['id'], build_event_body(appointment, location),
+                "Appointment Updated", format_notification_message(appointment, action="updated"),
+            ))
+        elif fingerprint_outdated(event, appointment) or (
+            location is not None and location_outdated(event, location)
+        ):
+            # Details are unchanged, so this is not a change the user needs to
+            # hear about; once written, the fingerprint spares the field comparison
+            operations.append(_operation(
+                'update', event['id'], build_event_body(appointment, location), None, None,
+            ))
+
+    for appointment, event_id in reconciliation.inserts:
+        location = locations.get(location_key(appointment.studio_name, appointment.address))
+        operations.append(_operation(
+            'insert', event_id, dict(build_event_body(appointment, location), id=event_id),
+            "New Appointment Added", format_notification_message(appointment),
+        ))
+
+    return operations
+
+
+def _operation(action, event_id, body, title, message):
+    return {
+        'request_id': f"{action}:{event_id}",
+        'action': action,
+        'event_id': event_id,
+        'body': body,
+        'title': title,
+        'message': message,
+    }
+
+
+def _request_for(service, operation, calendar_id):
+    if operation['action'] == 'delete':
+        return delete_google_calendar_event(service, operation['event_id'], calendar_id)
+    if operation['action'] == 'update':
+        return update_google_calendar_event(service, operation['event_id'], operation['body'], calendar_id)
+    return create_google_calendar_event(service, operation['body'], calendar_id)
+
+
+def _already_applied(operation, exception):
+    # A delete answered 404/410, or an insert answered 409, was applied earlier
+    status = error_status(exception)
+    if operation['action'] == 'delete':
+        return status in (404, 410)
+    return operation['action'] == 'insert' and status == 409
+
+
+def _own_event(event, operation):
+    # A deleted event may be revived; a live one only if it shows this very session
+    if event.get('status') == 'cancelled':
+        return True
+    private = event.get('extendedProperties', {}).get('private', {})
+    expected = operation['body']['extendedProperties']['private']
+    return (private.get('appointment_id') == expected['appointment_id']
+            and private.get('fingerprint') == expected['fingerprint'])
+
+
+def _next_session(operation):
+    appointment_id = operation['body']['extendedProperties']['private']['appointment_id']
+    suffix = operation['event_id'][len(appointment_id) + 1:]
+    ordinal = int(suffix) if operation['event_id'].startswith(appointment_id) and suffix.isdigit() else 0
+    event_id = calendar_event_id(appointment_id, ordinal + 1)
+    return dict(operation, event_id=event_id, body=dict(operation['body'], id=event_id))
+
+
+def apply_plan(service, operations, notifier, calendar_id=CALENDAR_ID, executor=None, journal=None):
+    """
+    Sends planned operations, marks them done in journal as their responses
+    arrive, and publishes a notification for each applied one.
+
+    An insert answered with 409 means an event with its id already exists.
+    If that event is this session's own, because an earlier attempt got
+    through or because the appointment was cancelled and has now come back,
+    it is overwritten with an update. Otherwise the id belongs to another
+    session of the same day (one not listed, such as a cancelled or started
+    one), and the insert is retried with the next session id.
+
+    Returns:
+        Dict mapping each failed event id to its exception
+    """
+    if executor is None:
+        executor = MutationExecutor()
+    by_request_id = {operation['request_id']: operation for operation in operations}
+
+    def record(batch_results):
+        if journal is not None:
+            # Conflicting inserts are only done once the follow-up update succeeds
+            journal.mark_done(
+                request_id for request_id, (_, exception) in batch_results.items()
+                if exception is None or (by_request_id[request_id]['action'] == 'delete'
+                                         and _already_applied(by_request_id[request_id], exception))
+            )
+
+    logger.info(f"Sending {len(operations)} calendar changes in batches...")
+    results = executor.execute(
+        service, [(operation['request_id'], _request_for(service, operation, calendar_id)) for operation in operations],
+        on_result=record,
+    )
+
+    current = dict(by_request_id)
+    conflicts = [
+        operation for operation in operations
+        if operation['action'] == 'insert' and results[operation['request_id']][1] is not None
+        and _already_applied(operation, results[operation['request_id']][1])
+    ]
+    probes = 0
+    while conflicts:
+        existing = executor.execute(service, [
+            (operation['request_id'], get_google_calendar_event(service, operation['event_id'], calendar_id))
+            for operation in conflicts
+        ])
+        overwrite, retry = [], []
+        for operation in conflicts:
+            event, exception = existing[operation['request_id']]
+            if exception is not None:
+                results[operation['request_id']] = (None, exception)
+            elif _own_event(event, operation):
+                overwrite.append(operation)
+            elif probes < MAX_SESSION_PROBES:
+                retry.append(_next_session(operation))
+            else:
+                results[operation['request_id']] = (None, RuntimeError(f"No free event id after {operation['event_id']}"))
+
+        if overwrite:
+            logger.info(f"Overwriting {len(overwrite)} existing events instead of inserting them...")
+            results.update(executor.execute(service, [
+                (operation['request_id'], update_google_calendar_event(
+                    service, operation['event_id'], dict(operation['body'], status='confirmed'), calendar_id
+                ))
+                for operation in overwrite
+            ], on_result=record))
+        if retry:
+            logger.info(f"Inserting {len(retry)} events under the next session id...")
+            current.update((operation['request_id'], operation) for operation in retry)
+            results.update(executor.execute(service, [
+                (operation['request_id'], create_google_calendar_event(service, operation['body'], calendar_id))
+                for operation in retry
+            ], on_result=record))
+        probes += 1
+        conflicts = [
+            operation for operation in retry
+            if results[operation['request_id']][1] is not None
+            and _already_applied(operation, results[operation['request_id']][1])
+        ]
+
+    failures = {}
+    for operation in (current[operation['request_id']] for operation in operations):
+        request_id, action = operation['request_id'], operation['action']
+        response, exception = results.get(request_id, (None, RuntimeError('No response in batch')))
+
+        if exception is not None and not _already_applied(operation, exception):
+            logger.warning(f"Failed to {action} event {operation['event_id']}: {exception}")
+            failures[operation['event_id']] = exception
+            metrics.incr('failed')
+            continue
+
+        metrics.incr(ACTION_COUNTERS[action])
+        logger.debug(f"Event {operation['event_id']} {ACTION_COUNTERS[action]}.")
+        if operation['title'] is not None:
+            notifier.publish(operation['title'], operation['message'], priority=1)
+
+    if journal is not None:
+        journal.finish()
+    if failures:
+        logger.warning(f"{len(failures)} of {len(operations)} calendar changes still failing: "
+                       f"{summarize_failures(failures)}")
+
+    return failures
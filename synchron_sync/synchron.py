@@ -0,0 +1,508 @@
+"""
+Login and appointment scraping for login.synchron.de.
+"""
+import html
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Tuple, Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from . import metrics
+from .appointments import SCRAPED_FIELDS
+from .transport import CircuitBreaker, backoff_delay, is_service_failure
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_BACKEND = 'lxml'
+except ImportError:
+    DEFAULT_BACKEND = 'html.parser'
+
+DATE_ROW_STYLE = 'color: white; background: #9BC7E6; width: 100px'
+APPOINTMENT_ROW_STYLE = 'color: black; background: whitesmoke'
+EVENTS_PATH = '/events?is_app=0'
+# Pagination link as rendered by Laravel's paginator
+NEXT_LINK = re.compile(r'<a\b[^>]*\brel=["\']next["\'][^>]*>', re.IGNORECASE)
+HREF = re.compile(r'\bhref=["\']([^"\']*)["\']', re.IGNORECASE)
+
+
+@dataclass
+class PageValidators:
+    """
+    HTTP cache validators of the events page.
+
+    login_with_retry sends them as conditional request headers and replaces
+    them with the ones of the new response; not_modified is set when
+    Synchron answers 304.
+    """
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+    def request_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def update(self, response: requests.Response) -> None:
+        self.not_modified = response.status_code == 304
+        if not self.not_modified:
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+
+
+@dataclass
+class EventsWindow:
+    """
+    Date window of the events view to scrape, split into ranges.
+
+    Each range is requested by appending range_query, with {start} and {end}
+    formatted with date_format, to the events URL; pages linked with
+    rel="next" from a range's page are followed.
+    """
+    days: int
+    range_days: int = 14
+    range_query: str = 'start={start}&end={end}'
+    date_format: str = '%Y-%m-%d'
+    # Pages fetched at the same time over the one session
+    max_workers: int = 4
+    # Guards against pagination that never ends
+    max_pages_per_range: int = 20
+
+    def horizon(self, today: date) -> date:
+        """
+        The first day after the window.
+        """
+        return today + timedelta(days=self.days)
+
+    def urls(self, base_url: str, today: date) -> List[str]:
+        urls = []
+        end = self.horizon(today)
+        start = today
+        while start < end:
+            range_end = min(start + timedelta(days=max(1, self.range_days)), end)
+            # Ranges are inclusive of their end date
+            query = self.range_query.format(
+                start=start.strftime(self.date_format),
+                end=(range_end - timedelta(days=1)).strftime(self.date_format),
+            )
+            urls.append(f"{base_url}{EVENTS_PATH}&{query}")
+            start = range_end
+        return urls
+
+
+def events_window(config) -> Optional[EventsWindow]:
+    """
+    Returns the EventsWindow configured for config, or None to scrape the single events page.
+    """
+    if config.synchron_window_days <= 0:
+        return None
+    return EventsWindow(
+        days=config.synchron_window_days,
+        range_days=config.synchron_range_days,
+        range_query=config.synchron_range_query,
+        date_format=config.synchron_range_date_format,
+        max_workers=config.synchron_page_workers,
+        max_pages_per_range=config.synchron_max_pages,
+    )
+
+
+def next_page_url(html_content: str, page_url: str) -> Optional[str]:
+    """
+    Returns the absolute URL of the rel="next" link of a page, if it has one.
+    """
+    link = NEXT_LINK.search(html_content)
+    if link is None:
+        return None
+    href = HREF.search(link.group(0))
+    return urljoin(page_url, html.unescape(href.group(1))) if href else None
+
+
+def fetch_events_window(session: requests.Session, urls: List[str], max_workers: int = 4,
+                        max_pages_per_range: int = 20, first_response: Optional[requests.Response] = None) -> list:
+    """
+    Fetches and parses every page of the given ranges of the events view.
+
+    Ranges are fetched concurrently over session; each page is parsed on its
+    worker as soon as it arrives, while further pages of the same range are
+    followed in order. The results are merged in date order with duplicates
+    (appointments listed on two overlapping pages) removed.
+
+    Args:
+        session: Logged-in session, shared by all workers
+        urls: First page URL of each range
+        max_workers: Pages fetched at the same time
+        max_pages_per_range: Pages followed per range at most
+        first_response: Already fetched response for urls[0]
+
+    Returns:
+        List of appointment dicts
+
+    Raises:
+        requests.RequestException: If a page fails or the session expired meanwhile
+        ValueError: If a range has more than max_pages_per_range pages or links
+            back to a page already fetched, so its appointments are incomplete
+    """
+    def fetch_range(index):
+        appointments = []
+        pages = 0
+        # (requests, bytes) the session's metrics hook cannot see from a worker
+        traffic = [0, 0]
+        url = urls[index]
+        seen = set()
+        while url is not None:
+            if url in seen:
+                raise ValueError(f"Pages of {urls[index]} link back to {url}")
+            if pages >= max_pages_per_range:
+                raise ValueError(f"{urls[index]} has more than {max_pages_per_range} pages")
+            seen.add(url)
+            if index == 0 and pages == 0 and first_response is not None:
+                response = first_response
+            else:
+                response = session.get(url)
+                for hop in response.history + [response]:
+                    traffic[0] += 1
+                    traffic[1] += len(hop.content)
+                response.raise_for_status()
+            if is_login_page(response):
+                raise requests.RequestException(f"Synchron session expired while fetching {url}")
+            appointments.extend(parse_appointments(response.text))
+            pages += 1
+            url = next_page_url(response.text, response.url or url)
+        return appointments, pages, traffic
+
+    with metrics.span('synchron_pages'):
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='synchron-page') as executor:
+            results = list(executor.map(fetch_range, range(len(urls))))
+
+    # Counted here because worker threads do not see the run's metrics
+    metrics.incr('synchron_pages', sum(pages for _, pages, _ in results))
+    metrics.incr('http_requests', sum(traffic[0] for _, _, traffic in results))
+    metrics.incr('http_bytes', sum(traffic[1] for _, _, traffic in results))
+    merged = {}
+    for appointments, _, _ in results:
+        for appointment in appointments:
+            merged.setdefault(tuple(appointment.get(field, '') for field in SCRAPED_FIELDS), appointment)
+    logger.info(f"Fetched {len(merged)} appointments from {sum(pages for _, pages, _ in results)} pages "
+                f"in {len(urls)} date ranges.")
+    return sorted(merged.values(), key=_appointment_sort_key)
+
+
+def _appointment_sort_key(appointment):
+    try:
+        day = datetime.strptime(appointment['date'], '%d.%m.%Y')
+    except ValueError:
+        day = datetime.max
+    return day, appointment['start_time']
+
+
+def login_with_retry(
+    session: requests.Session,
+    base_url: str,
+    login_url: str,
+    username: str,
+    password: str,
+    max_retries: int = 3,
+    retry_delay: int = 5,
+    session_cache=None,
+    validators: Optional[PageValidators] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    sleep: Callable[[float], None] = time.sleep,
+    window: Optional[EventsWindow] = None,
+    today: Optional[date] = None
+) -> Tuple[bool, Optional[list]]:
+    """
+    Attempts to login with retry mechanism.
+
+    Cookies already on the session, or else those in session_cache, are
+    tried first by going straight to the events page; the CSRF/login round
+    trips only happen if Synchron redirects to the login page. Attempts are
+    spaced with jittered exponential backoff, and stop early once breaker
+    has seen Synchron fail too often.
+
+    Args:
+        session: requests Session object
+        base_url: Base URL for the website
+        login_url: Login endpoint URL
+        username: Login username
+        password: Login password
+        max_retries: Maximum number of retry attempts
+        retry_delay: Delay before the first retry in seconds, doubled for each further one
+        session_cache: Optional SessionCache holding cookies from an earlier run
+        validators: Optional PageValidators for a conditional events page request
+        breaker: Optional CircuitBreaker for Synchron, shared between runs
+        sleep: Waits between attempts; the daemon passes one that returns on shutdown
+        window: Optional EventsWindow to scrape instead of the single events page;
+            validators are not used with it
+        today: First day of window, the current date if omitted
+
+    Returns:
+        Tuple of (success_status: bool, appointments: Optional[list]);
+        appointments is None if the events page was not modified
+    """
+    if window is not None:
+        range_urls = window.urls(base_url, today or date.today())
+        appointments_url = range_urls[0]
+        # One page's validators say nothing about the others
+        validators = None
+    else:
+        appointments_url = f"{base_url}{EVENTS_PATH}"
+
+    def get_appointments():
+        headers = validators.request_headers() if validators is not None else {}
+        with metrics.span('synchron_events'):
+            response = session.get(appointments_url, headers=headers)
+        response.raise_for_status()
+        if validators is not None:
+            validators.update(response)
+        return response
+
+    def parse(response):
+        if response.status_code == 304:
+            logger.info("Events page not modified.")
+            return None
+        if window is not None:
+            return fetch_events_window(
+                session, range_urls, window.max_workers, window.max_pages_per_range, first_response=response
+            )
+        with metrics.span('parse'):
+            return parse_appointments(response.text)
+
+    def scraped(response):
+        try:
+            return True, parse(response)
+        except ValueError as e:
+            # A partial list would delete the missing appointments' events, and
+            # another attempt would stop at the same page
+            logger.warning(f"Events listing is incomplete: {e}")
+            return False, None
+
+    def circuit_open():
+        if breaker is not None and not breaker.allow():
+            logger.warning("Synchron has been failing; not trying again until the circuit breaker resets.")
+            metrics.incr('synchron_circuit_open')
+            return True
+        return False
+
+    def record(success):
+        if breaker is None:
+            return
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    if circuit_open():
+        return False, None
+
+    # Cookies already on the session (long-running process) win over the on-disk cache
+    if session.cookies or (session_cache is not None and session_cache.load(session)):
+        try:
+            logger.info("Trying cached Synchron session...")
+            appointments_response = get_appointments()
+            record(True)
+
+            if not is_login_page(appointments_response):
+                logger.info("Cached session is still valid.")
+                if session_cache is not None:
+                    session_cache.save(session)
+                return scraped(appointments_response)
+
+            logger.info("Cached session expired. Logging in again...")
+        except requests.RequestException as e:
+            logger.warning(f"Cached session check failed with error: {str(e)}")
+            record(not is_service_failure(e))
+        session.cookies.clear()
+
+    for attempt in range(max_retries):
+        if attempt:
+            metrics.incr('synchron_retries')
+        try:
+            logger.info(f"Login attempt {attempt + 1}/{max_retries}...")
+
+            # Get CSRF token
+            with metrics.span('synchron_csrf'):
+                response = session.get(base_url)
+                response.raise_for_status()  # Raise exception for bad status codes
+
+                soup = BeautifulSoup(response.text, 'html.parser')
+                csrf_token_element = soup.find('input', {'name': '_token'})
+
+            record(True)
+            if not csrf_token_element:
+                logger.warning(f"Attempt {attempt + 1}: Failed to retrieve CSRF token")
+                if attempt < max_retries - 1:
+                    sleep(backoff_delay(attempt, retry_delay))
+                continue
+
+            csrf_token = csrf_token_element['value']
+            logger.debug(f"Retrieved CSRF token: {csrf_token}")
+
+            # Prepare login payload
+            login_payload = {
+                'username': username,
+                'password': password,
+                '_token': csrf_token
+            }
+
+            # Attempt login
+            with metrics.span('synchron_login'):
+                login_response = session.post(login_url, data=login_payload)
+            login_response.raise_for_status()
+
+            # Verify successful login by checking for 'Termine' in response
+            if 'Termine' in login_response.text:
+                logger.info("Login successful!")
+
+                # Get appointments
+                appointments_response = get_appointments()
+
+                if session_cache is not None:
+                    session_cache.save(session)
+
+                return scraped(appointments_response)
+            else:
+                logger.warning(f"Attempt {attempt + 1}: Login response didn't contain expected content")
+
+        except requests.RequestException as e:
+            logger.warning(f"Attempt {attempt + 1} failed with error: {str(e)}")
+            # Synchron answered, so a 4xx must not stop the accounts sharing the breaker
+            record(not is_service_failure(e))
+
+        if attempt < max_retries - 1:
+            if circuit_open():
+                return False, None
+            delay = backoff_delay(attempt, retry_delay)
+            logger.info(f"Waiting {delay:.1f} seconds before next attempt...")
+            sleep(delay)
+
+    logger.warning(f"Failed to login after {max_retries} attempts")
+    return False, None
+
+
+def is_login_page(response: requests.Response) -> bool:
+    """
+    True if the request was redirected to the Synchron login page.
+    """
+    return bool(response.history) and urlparse(response.url).path.startswith('/login')
+
+
+def parse_appointments(html_content: str, backend: Optional[str] = None) -> list:
+    """
+    Parses the appointments from the HTML content of the events page.
+
+    Table rows are walked once in document order; each date header row sets
+    the date for the appointment rows that follow it.
+
+    Args:
+        html_content: HTML of the events page
+        backend: 'lxml' or 'html.parser'; defaults to lxml when it is installed
+
+    Returns:
+        List of appointment dicts in page order
+    """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    if backend == 'lxml':
+        return _parse_appointments_lxml(html_content)
+    return _parse_appointments_bs4(html_content)
+
+
+def _parse_appointments_bs4(html_content: str) -> list:
+    appointments = []
+    date = ''
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for row in soup.find_all('tr'):
+        style = row.get('style')
+        if style == DATE_ROW_STYLE:
+            cells = row.find_all('td')
+            date = cells[1].get_text(strip=True) if len(cells) > 1 else ''
+        elif style == APPOINTMENT_ROW_STYLE:
+            columns = row.find_all('td')
+            if len(columns) == 5:
+                studio_name_element = columns[1].find('b')
+                appointments.append(_build_appointment(
+                    date,
+                    columns[0].get_text(strip=True),
+                    studio_name_element.get_text(strip=True) if studio_name_element else '',
+                    list(columns[1].stripped_strings),
+                ))
+
+    return appointments
+
+
+def _parse_appointments_lxml(html_content: str) -> list:
+    import lxml.html
+
+    appointments = []
+    date = ''
+    if not html_content.strip():
+        return appointments
+    document = lxml.html.document_fromstring(html_content)
+
+    for row in document.iter('tr'):
+        style = row.get('style')
+        if style == DATE_ROW_STYLE:
+            cells = list(row.iterdescendants('td'))
+            date = _joined_text(cells[1]) if len(cells) > 1 else ''
+        elif style == APPOINTMENT_ROW_STYLE:
+            columns = list(row.iterdescendants('td'))
+            if len(columns) == 5:
+                studio_name_element = next(columns[1].iterdescendants('b'), None)
+                appointments.append(_build_appointment(
+                    date,
+                    _joined_text(columns[0]),
+                    _joined_text(studio_name_element) if studio_name_element is not None else '',
+                    _stripped_strings(columns[1]),
+                ))
+
+    return appointments
+
+
+def _stripped_strings(element) -> list:
+    # Same as BeautifulSoup's Tag.stripped_strings
+    return [text.strip() for text in element.itertext() if text.strip()]
+
+
+def _joined_text(element) -> str:
+    # Same as BeautifulSoup's Tag.get_text(strip=True)
+    return ''.join(_stripped_strings(element))
+
+
+def _build_appointment(date: str, time_range: str, studio_name: str, column_texts: list) -> dict:
+    time_range = time_range.replace('\n', ' ')
+    start_time = time_range[:5]
+    end_time = time_range[5:].strip()
+
+    if studio_name in column_texts:
+        column_texts.remove(studio_name)
+
+    address = ''
+    regie = ''
+
+    for text in column_texts:
+        if text.startswith('Regie:'):
+            regie = text
+        else:
+            address += text + ' '
+
+    return {
+        'date': date,
+        'start_time': start_time,
+        'end_time': end_time,
+        'studio_name': studio_name,
+        'address': address.strip(),
+        'regie': regie
+    }
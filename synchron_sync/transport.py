@@ -0,0 +1,185 @@
+"""
+Shared HTTP transport for Synchron, Pushover and Google.
+
+Every request gets connect and read timeouts, connections are kept alive
+in a sized pool, and idempotent requests are retried by urllib3 with
+jittered exponential backoff on connection errors and 429/5xx answers.
+A Retry-After header is honoured up to the backoff maximum. A
+CircuitBreaker lets a run give up quickly once Synchron is clearly down.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Google Calendar requests go through httplib2, which has a single timeout
+GOOGLE_TIMEOUT = 60
+POOL_MAXSIZE = 4
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest wait between two transport retries, whatever Retry-After asks for
+BACKOFF_MAX = 10.0
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default (connect, read) timeout to requests without one.
+    """
+
+    def __init__(self, *args, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+class CappedRetry(Retry):
+    """
+    Retry that waits at most backoff_max seconds for a Retry-After header.
+
+    A server asking for an hour's pause would otherwise stall the run, or
+    the daemon, inside a single request.
+    """
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+
+
+def retry_policy(total: int = 2, backoff_factor: float = 0.5) -> Retry:
+    """
+    urllib3 retries for idempotent methods only; a POST such as the Synchron
+    login or a Pushover message is never sent twice by the transport.
+    """
+    return CappedRetry(
+        total=total,
+        backoff_factor=backoff_factor,
+        backoff_max=BACKOFF_MAX,
+        backoff_jitter=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        # Hand the last 5xx response back so callers see the real status
+        raise_on_status=False,
+    )
+
+
+def build_adapter(pool_maxsize: int = POOL_MAXSIZE, retries: Optional[Retry] = None) -> TimeoutHTTPAdapter:
+    return TimeoutHTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        max_retries=retries if retries is not None else retry_policy(),
+    )
+
+
+def build_session(adapter: Optional[HTTPAdapter] = None) -> requests.Session:
+    """
+    Returns a session that sends everything through adapter (a new one if omitted).
+
+    Sessions may share one adapter, and with it the connection pool, while
+    keeping their own cookies. Responses are gzip-decoded by requests.
+    """
+    adapter = adapter or build_adapter()
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_google_http():
+    """
+    Returns an httplib2.Http with the transport's timeout for the Calendar client.
+    """
+    import httplib2
+
+    return httplib2.Http(timeout=GOOGLE_TIMEOUT)
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 60.0, rng: Optional[random.Random] = None) -> float:
+    """
+    Exponential backoff with jitter: between half and all of min(cap, base * 2**attempt).
+
+    Args:
+        attempt: Number of failed attempts so far minus one (0 before the first retry)
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return delay * (rng or random).uniform(0.5, 1.0)
+
+
+def is_service_failure(exception: requests.RequestException) -> bool:
+    """
+    True if exception means the server is unreachable or failing: a
+    connection error, a timeout or a 5xx answer. 4xx answers such as a
+    rejected login or a rate limit only concern the request that got them.
+    """
+    if isinstance(exception, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(exception, 'response', None)
+    return isinstance(exception, requests.HTTPError) and response is not None and response.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a service after failure_threshold consecutive failures.
+
+    While open, allow() returns False; after reset_timeout seconds a single
+    trial call is let through (half-open) and its outcome closes or reopens
+    the circuit. Thread-safe, so accounts syncing in parallel can share one.
+    """
+
+    def __init__(self, failure_threshold: int = 2, reset_timeout: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures.")
+                self._opened_at = self._clock()
+            self._trial_running = False